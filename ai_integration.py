@@ -6,10 +6,12 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
-def init() -> OpenAI:
-    api_key = os.getenv("GITHUB_AI_TOKEN")
-    base_url = os.getenv("GITHUB_AI_ENDPOINT")
-    model = os.getenv("GITHUB_AI_MODEL")
+class LLMTimeoutError(TimeoutError):
+    """Raised when an LLM call does not finish within its deadline."""
+
+def init(base_url: str | None = None, api_key: str | None = None) -> OpenAI:
+    api_key = api_key or os.getenv("GITHUB_AI_TOKEN")
+    base_url = base_url or os.getenv("GITHUB_AI_ENDPOINT")
 
     return OpenAI(api_key=api_key, base_url=base_url)
 
@@ -24,19 +26,30 @@ def sanitize_json_response(raw_text: str) -> str:
 
     return raw_text.strip()
 
-def call_llm(client: OpenAI, system_prompt: str, user_prompt: str, model: str) -> dict:
-    response = client.chat.completions.create(
-        messages=[
+def build_chat_request(system_prompt: str, user_prompt: str | list, model: str) -> dict:
+    return {
+        "messages": [
             { "role": "system", "content": system_prompt },
             { "role": "user", "content": user_prompt }
         ],
-        temperature=0,
-        model=model
-    )
-    content = response.choices[0].message.content.strip()
+        "temperature": 0,
+        "model": model
+    }
+
+def parse_llm_json(content: str) -> dict:
     content = sanitize_json_response(content)
 
     try:
         return json.loads(content)
     except json.JSONDecodeError as e:
-        raise ValueError(f"Failed to parse LLM response as JSON: {e}\nRaw content: {content}")
\ No newline at end of file
+        raise ValueError(f"Failed to parse LLM response as JSON: {e}\nRaw content: {content}")
+
+def call_llm(client: OpenAI, system_prompt: str, user_prompt: str | list, model: str, timeout: float | None = None) -> dict:
+    request = build_chat_request(system_prompt, user_prompt, model)
+    if timeout is not None:
+        request["timeout"] = timeout
+
+    response = client.chat.completions.create(**request)
+    content = response.choices[0].message.content.strip()
+
+    return parse_llm_json(content)
\ No newline at end of file
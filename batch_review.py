@@ -0,0 +1,363 @@
+import argparse
+import glob
+import hashlib
+import io
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from ai_integration import init, build_chat_request, parse_llm_json
+from model_routing import resolve_route
+from page_store import dump_document, load_document
+from profiling import PROFILE_MODES, profile_stage, settings_from_env
+from review_report import SYSTEM_PROMPT, build_user_prompt
+
+
+CHAT_COMPLETIONS_URL = "/v1/chat/completions"
+
+# Provider limit on requests per Batch API input file
+MAX_REQUESTS_PER_BATCH = 50000
+POLL_INTERVAL_SECONDS = 30
+
+
+def discover_documents(paths: list) -> list:
+    """
+    Expand input paths into output_s5 documents. Directories are searched recursively.
+    """
+    documents = []
+    for path in paths:
+        if os.path.isdir(path):
+            documents.extend(sorted(glob.glob(os.path.join(path, "**", "output_s5.json"), recursive=True)))
+        else:
+            documents.append(path)
+    return [os.path.abspath(p) for p in documents]
+
+
+def custom_id_for(document_path: str, body: dict) -> str:
+    """
+    Id of one document's review request. It includes a hash of the request body
+    (messages and model), so a changed prompt, model or document is a new
+    request instead of being skipped as already reviewed.
+    """
+    body_hash = hashlib.sha1(json.dumps(body, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()[:12]
+    return "review-" + hashlib.sha1(document_path.encode("utf-8")).hexdigest()[:20] + "-" + body_hash
+
+
+def default_output_path(document_path: str) -> str:
+    return os.path.join(os.path.dirname(document_path), "output_s6.json")
+
+
+class BatchReviewState:
+    """
+    Persists which documents have been queued, submitted and ingested, so a
+    rerun of the same command resumes instead of starting over.
+    """
+
+    def __init__(self, batch_dir: str):
+        self.batch_dir = batch_dir
+        self.requests_path = os.path.join(batch_dir, "requests.jsonl")
+        self.results_path = os.path.join(batch_dir, "results.jsonl")
+        self.state_path = os.path.join(batch_dir, "state.json")
+
+        os.makedirs(batch_dir, exist_ok=True)
+
+        if os.path.exists(self.state_path):
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                self.state = json.load(f)
+        else:
+            self.state = {"documents": {}, "batches": []}
+
+    @property
+    def documents(self) -> dict:
+        return self.state["documents"]
+
+    def save(self):
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, self.state_path)
+
+    def completed_ids(self) -> set:
+        if not os.path.exists(self.results_path):
+            return set()
+        with open(self.results_path, "r", encoding="utf-8") as f:
+            return {json.loads(line)["custom_id"] for line in f if line.strip()}
+
+
+def print_progress(label: str, done: int, total: int):
+    print(f"{label}: [{done}/{total}]", flush=True)
+
+
+def prepare_requests(state: BatchReviewState, document_paths: list, model: str) -> int:
+    """
+    Append one Batch API request line per new or changed request to
+    requests.jsonl. Earlier requests for the same document are superseded.
+    State is saved with every flushed batch of lines; lines written after the
+    last save are ignored by load_pending_requests and re-added on the next run.
+    """
+    # input_path -> custom_ids of its requests that are not superseded yet
+    current = {}
+    for cid, entry in state.documents.items():
+        if entry["status"] != "superseded":
+            current.setdefault(entry["input_path"], []).append(cid)
+
+    added = 0
+    with open(state.requests_path, "a", encoding="utf-8") as f:
+        for i, path in enumerate(document_paths, start=1):
+            data = load_document(path)
+
+            body = build_chat_request(SYSTEM_PROMPT, build_user_prompt(data), model)
+            custom_id = custom_id_for(path, body)
+            if custom_id in state.documents:
+                continue
+
+            for cid in current.get(path, []):
+                state.documents[cid]["status"] = "superseded"
+            current[path] = [custom_id]
+
+            request = {
+                "custom_id": custom_id,
+                "method": "POST",
+                "url": CHAT_COMPLETIONS_URL,
+                "body": body
+            }
+            f.write(json.dumps(request, ensure_ascii=False) + "\n")
+
+            state.documents[custom_id] = {
+                "input_path": path,
+                "output_path": default_output_path(path),
+                "status": "queued"
+            }
+            added += 1
+
+            if i % 100 == 0:
+                f.flush()
+                state.save()
+                print_progress("Prepared", i, len(document_paths))
+
+    state.save()
+    return added
+
+
+def load_pending_requests(state: BatchReviewState) -> list:
+    """
+    Requests not yet answered, once per custom_id. Lines without a state entry
+    (written by an interrupted prepare_requests) are skipped.
+    """
+    completed = state.completed_ids()
+    pending = {}
+    with open(state.requests_path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            custom_id = request["custom_id"]
+            entry = state.documents.get(custom_id)
+            if entry is None or entry["status"] == "superseded" or custom_id in completed:
+                continue
+            pending.setdefault(custom_id, request)
+    return list(pending.values())
+
+
+def run_local(state: BatchReviewState, concurrency: int):
+    """
+    Execute the request file directly against the chat endpoint, appending
+    Batch-API-shaped result lines as each call finishes.
+    """
+    pending = load_pending_requests(state)
+    total = len(pending)
+    if not total:
+        return
+
+    client = init()
+
+    def execute(request: dict) -> dict:
+        try:
+            response = client.chat.completions.create(**request["body"])
+            return {
+                "custom_id": request["custom_id"],
+                "response": {"status_code": 200, "body": response.model_dump()},
+                "error": None
+            }
+        except Exception as e:
+            return {"custom_id": request["custom_id"], "response": None, "error": {"message": str(e)}}
+
+    with open(state.results_path, "a", encoding="utf-8") as results_file:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            futures = [executor.submit(execute, r) for r in pending]
+            for done, future in enumerate(as_completed(futures), start=1):
+                results_file.write(json.dumps(future.result(), ensure_ascii=False) + "\n")
+                results_file.flush()
+                print_progress("Reviewed", done, total)
+
+
+def submit_provider_batches(state: BatchReviewState, client):
+    pending = load_pending_requests(state)
+    submitted = {cid for batch in state.state["batches"] for cid in batch["custom_ids"]}
+    pending = [r for r in pending if r["custom_id"] not in submitted]
+
+    for start in range(0, len(pending), MAX_REQUESTS_PER_BATCH):
+        chunk = pending[start:start + MAX_REQUESTS_PER_BATCH]
+        payload = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in chunk).encode("utf-8")
+
+        input_file = client.files.create(file=("requests.jsonl", io.BytesIO(payload)), purpose="batch")
+        batch = client.batches.create(
+            input_file_id=input_file.id,
+            endpoint=CHAT_COMPLETIONS_URL,
+            completion_window="24h"
+        )
+
+        state.state["batches"].append({
+            "batch_id": batch.id,
+            "input_file_id": input_file.id,
+            "custom_ids": [r["custom_id"] for r in chunk],
+            "downloaded": False
+        })
+        for r in chunk:
+            state.documents[r["custom_id"]]["status"] = "submitted"
+        state.save()
+        print(f"Submitted batch {batch.id} with {len(chunk)} requests.")
+
+
+def run_provider_batch(state: BatchReviewState, poll_interval: int = POLL_INTERVAL_SECONDS):
+    """
+    Submit pending requests through the provider's Batch API, poll until every
+    batch finishes, and download the output files into results.jsonl.
+    """
+    client = init()
+    submit_provider_batches(state, client)
+
+    while True:
+        waiting = 0
+        for entry in state.state["batches"]:
+            if entry["downloaded"]:
+                continue
+
+            batch = client.batches.retrieve(entry["batch_id"])
+            counts = batch.request_counts
+            if counts:
+                print_progress(f"Batch {batch.id} ({batch.status})", counts.completed + counts.failed, counts.total)
+
+            if batch.status in ("completed", "failed", "expired", "cancelled"):
+                with open(state.results_path, "a", encoding="utf-8") as results_file:
+                    for file_id in (batch.output_file_id, batch.error_file_id):
+                        if file_id:
+                            results_file.write(client.files.content(file_id).text.rstrip("\n") + "\n")
+                entry["downloaded"] = True
+                state.save()
+            else:
+                waiting += 1
+
+        if not waiting:
+            return
+        time.sleep(poll_interval)
+
+
+def ingest_results(state: BatchReviewState) -> dict:
+    """
+    Write each successful review into its paper's review field.
+    Documents already ingested are skipped, so this is safe to rerun.
+    """
+    counts = {"ingested": 0, "failed": 0}
+    if not os.path.exists(state.results_path):
+        return counts
+
+    with open(state.results_path, "r", encoding="utf-8") as f:
+        results = [json.loads(line) for line in f if line.strip()]
+
+    for done, result in enumerate(results, start=1):
+        entry = state.documents.get(result["custom_id"])
+        if entry is None or entry["status"] in ("ingested", "failed", "superseded"):
+            continue
+
+        response = result.get("response") or {}
+        if result.get("error") or response.get("status_code") != 200:
+            entry["status"] = "failed"
+            entry["error"] = result.get("error") or response.get("body")
+            counts["failed"] += 1
+            continue
+
+        try:
+            content = response["body"]["choices"][0]["message"]["content"].strip()
+            review_json = parse_llm_json(content)
+        except (KeyError, IndexError, ValueError) as e:
+            entry["status"] = "failed"
+            entry["error"] = str(e)
+            counts["failed"] += 1
+            continue
+
+        data = load_document(entry["input_path"])
+
+        data["review"] = review_json
+
+        dump_document(data, entry["output_path"])
+
+        entry["status"] = "ingested"
+        entry.pop("error", None)
+        counts["ingested"] += 1
+
+        if done % 100 == 0:
+            print_progress("Ingested", done, len(results))
+            state.save()
+
+    state.save()
+    return counts
+
+
+def retry_failed(state: BatchReviewState):
+    """
+    Drop failed results so the next run re-executes those requests.
+    """
+    failed = {cid for cid, entry in state.documents.items() if entry["status"] == "failed"}
+    if not failed or not os.path.exists(state.results_path):
+        return
+
+    with open(state.results_path, "r", encoding="utf-8") as f:
+        kept = [line for line in f if line.strip() and json.loads(line)["custom_id"] not in failed]
+    with open(state.results_path, "w", encoding="utf-8") as f:
+        f.writelines(kept)
+
+    for entry in state.state["batches"]:
+        entry["custom_ids"] = [cid for cid in entry["custom_ids"] if cid not in failed]
+    for cid in failed:
+        state.documents[cid]["status"] = "queued"
+    state.save()
+
+
+def batch_review(document_paths: list, batch_dir: str, model: str, mode: str = "local", concurrency: int = 4, retry: bool = False) -> dict:
+    state = BatchReviewState(batch_dir)
+
+    if retry:
+        retry_failed(state)
+
+    added = prepare_requests(state, discover_documents(document_paths), model)
+    print(f"Queued {added} new documents ({len(state.documents)} total).")
+
+    if mode == "openai":
+        run_provider_batch(state)
+    else:
+        run_local(state, concurrency)
+
+    counts = ingest_results(state)
+    print(f"Ingested {counts['ingested']} reviews, {counts['failed']} failed.")
+    return counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-review many Stage #05 outputs in one batch.")
+    parser.add_argument("paths", nargs="+", help="output_s5.json files or directories containing them")
+    parser.add_argument("--batch-dir", default="batch_review", help="where requests, results and resume state are kept")
+    parser.add_argument("--model", default=resolve_route("review_report")["models"][0]["model"],
+                        help="defaults to the review_report route's primary model")
+    parser.add_argument("--mode", choices=["local", "openai"], default="local",
+                        help="local: run the request file against the chat endpoint; openai: use the Batch API")
+    parser.add_argument("--concurrency", type=int, default=4, help="parallel requests in local mode")
+    parser.add_argument("--retry-failed", action="store_true", help="re-run requests whose results failed")
+    parser.add_argument("--profile", choices=PROFILE_MODES, default=None,
+                        help="profile the batch with cProfile or the stack sampler; profiles go to batch-dir/profiles")
+    parser.add_argument("--profile-memory", action="store_true", help="track allocations with tracemalloc")
+    args = parser.parse_args()
+
+    profile = settings_from_env(os.path.join(args.batch_dir, "profiles"), args.profile, memory=args.profile_memory)
+    with profile_stage("batch_review", profile):
+        batch_review(args.paths, args.batch_dir, args.model, args.mode, args.concurrency, args.retry_failed)
@@ -0,0 +1,135 @@
+import argparse
+import random
+import re
+import statistics
+import time
+from extractor import extract_captions_from_text
+from line_scanner import SECTION_PATTERNS, scan_lines
+from outline import extract_abstract, extract_heading_candidates
+
+
+# The per-line regexes the pipeline used before line_scanner, kept as the baseline
+LEGACY_CAPTION_REGEX = re.compile(r"^(Figure|Fig\.|Table)\s+\d+[:\.]?\s+.*", re.IGNORECASE)
+LEGACY_SECTION_REGEX = re.compile(
+    r"^(\d+(\.\d+)*)?\s*(" + "|".join(SECTION_PATTERNS) + r")\s*$",
+    re.IGNORECASE
+)
+LEGACY_ABSTRACT_HEADER_REGEX = re.compile(r"^abstract\s*$", re.IGNORECASE)
+
+WORDS = (
+    "model training loss attention layer token dataset baseline accuracy we propose "
+    "results show that our method improves over prior work on benchmark tasks with "
+    "fewer parameters and lower latency under the same compute budget"
+).split()
+
+HEADINGS = ["Introduction", "Related Work", "Method", "Experiments", "Results", "Discussion", "Conclusion"]
+
+
+def synthetic_pages(page_count: int, lines_per_page: int = 60, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    pages = []
+    for n in range(1, page_count + 1):
+        lines = []
+        if n == 1:
+            lines += ["A Synthetic Paper About Things", "Abstract"]
+        for _ in range(lines_per_page):
+            r = rng.random()
+            if r < 0.02:
+                lines.append(rng.choice(HEADINGS))
+            elif r < 0.04:
+                lines.append(f"{rng.choice(['Figure', 'Table', 'Fig.'])} {rng.randint(1, 20)}: " + " ".join(rng.choices(WORDS, k=8)))
+            elif r < 0.05:
+                lines.append(f"{rng.randint(1, 9)}.{rng.randint(1, 9)} " + " ".join(rng.choices(WORDS, k=3)).title())
+            else:
+                lines.append(" ".join(rng.choices(WORDS, k=rng.randint(6, 14))))
+        lines.append(str(n))
+        pages.append({"page_number": n, "text": "\n".join(lines)})
+    return pages
+
+
+def legacy_scan(pages: list):
+    """
+    One pass per consumer, each re-splitting the page and running its own regex.
+    """
+    captions = []
+    for page in pages:
+        lines = [ln.strip() for ln in page["text"].split("\n") if ln.strip()]
+        captions += [ln for ln in lines if LEGACY_CAPTION_REGEX.match(ln)]
+
+    headings = []
+    for page in pages:
+        lines = [ln.strip() for ln in page["text"].split("\n") if ln.strip()]
+        headings += [(page["page_number"], ln) for ln in lines if LEGACY_SECTION_REGEX.match(ln)]
+
+    full_lines = [ln.strip() for page in pages for ln in page["text"].split("\n") if ln.strip()]
+    start = next((i + 1 for i, ln in enumerate(full_lines) if LEGACY_ABSTRACT_HEADER_REGEX.match(ln)), None)
+    abstract = []
+    if start is not None:
+        for ln in full_lines[start:]:
+            if LEGACY_SECTION_REGEX.match(ln) and not LEGACY_ABSTRACT_HEADER_REGEX.match(ln):
+                break
+            abstract.append(ln)
+
+    return captions, headings, abstract
+
+
+def scanner_scan(pages: list):
+    """
+    Classify every line once at extraction time; consumers read the stored classes.
+    """
+    captions = []
+    for page in pages:
+        lines = [ln.strip() for ln in page["text"].split("\n") if ln.strip()]
+        page["line_classes"] = scan_lines(lines)
+        captions += extract_captions_from_text(page["text"], page["page_number"], page["line_classes"])
+
+    headings = extract_heading_candidates(pages)
+    abstract = extract_abstract(pages)
+    return captions, headings, abstract
+
+
+def time_once(fn, pages: list) -> float:
+    for page in pages:
+        page.pop("line_classes", None)
+    start = time.perf_counter()
+    fn(pages)
+    return time.perf_counter() - start
+
+
+def paired_timings(pages: list, repeat: int) -> tuple:
+    """
+    Alternate the two implementations on every repeat so machine noise and
+    drift hit both alike. Returns (legacy timings, scanner timings).
+    """
+    legacy, scanner = [], []
+    for _ in range(repeat):
+        legacy.append(time_once(legacy_scan, pages))
+        scanner.append(time_once(scanner_scan, pages))
+    return legacy, scanner
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare per-consumer regex passes with the single line scanner.")
+    parser.add_argument("--pages", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=31)
+    args = parser.parse_args()
+
+    pages = synthetic_pages(args.pages)
+    line_count = sum(page["text"].count("\n") + 1 for page in pages)
+
+    legacy_captions, legacy_headings, legacy_abstract = legacy_scan(pages)
+    captions, headings, abstract = scanner_scan(pages)
+    assert [c["text"] for c in captions] == legacy_captions
+    assert [(h["page"], h["raw_heading"]) for h in headings] == list(dict.fromkeys(legacy_headings))
+    assert abstract == (" ".join(" ".join(legacy_abstract).split()) or None)
+
+    legacy_timings, scanner_timings = paired_timings(pages, args.repeat)
+    legacy = statistics.median(legacy_timings)
+    scanner = statistics.median(scanner_timings)
+    ratios = [a / b for a, b in zip(legacy_timings, scanner_timings)]
+    q1, _, q3 = statistics.quantiles(ratios, n=4)
+
+    print(f"{args.pages} pages, {line_count} lines, median of {args.repeat} paired runs")
+    print(f"legacy passes: {legacy * 1000:.1f} ms ({line_count / legacy / 1e6:.2f} M lines/s)")
+    print(f"line scanner:  {scanner * 1000:.1f} ms ({line_count / scanner / 1e6:.2f} M lines/s)")
+    print(f"speedup:       {statistics.median(ratios):.2f}x (interquartile {q1:.2f}-{q3:.2f}x)")
@@ -1,7 +1,11 @@
 import json
 import os
 import sys
-from ai_integration import init, call_llm
+from incremental import prompt_fingerprint, reuse_stage_output
+from model_routing import call_stage_llm
+from page_store import dump_document, load_document
+from retrieval import load_or_build_index, pages_in_ranges, retrieval_cache_dir, retrieve
+from run_context import RunContext
 
 
 SYSTEM_PROMPT = """
@@ -22,6 +26,9 @@ Rules:
 - Output must be valid JSON only. No markdown.
 """
 
+INTRO_QUERY = "problem we propose motivation challenge existing approaches limitation contributions introduce novel"
+CONCLUSION_QUERY = "conclusion limitations future work discussion we showed results demonstrate"
+
 def find_section_pages(outline_sections, target_names):
     """
     Returns list of (start_page, end_page) for matching section names.
@@ -34,42 +41,31 @@ def find_section_pages(outline_sections, target_names):
                 ranges.append((sec["start_page"], sec["end_page"]))
     return ranges
 
-def collect_text_from_page_ranges(pages, page_ranges):
-    """
-    Collect text from specific page ranges.
-    """
-    collected = []
-    for start, end in page_ranges:
-        for p in pages:
-            if start <= p["page_number"] <= end:
-                collected.append(f"[PAGE {p['page_number']}]\n{p['text']}")
-    return "\n\n".join(collected)
-
-def build_user_prompt(data: dict) -> str:
+def build_user_prompt(data: dict, index=None) -> str:
     outline = data.get("outline", {})
     sections = outline.get("sections", [])
     pages = data.get("pages", [])
     abstract = outline.get("abstract", "")
 
-    intro_ranges = find_section_pages(sections, ["introduction"])
-    concl_ranges = find_section_pages(sections, ["conclusion", "discussion", "limitations"])
+    if index is None:
+        index = load_or_build_index(pages)
 
-    intro_text = collect_text_from_page_ranges(pages, intro_ranges)
-    concl_text = collect_text_from_page_ranges(pages, concl_ranges)
+    # Section matches only boost retrieval; the intro usually sits on the first pages
+    intro_pages = pages_in_ranges(find_section_pages(sections, ["introduction"])) or {1, 2}
+    concl_pages = pages_in_ranges(find_section_pages(sections, ["conclusion", "discussion", "limitations"]))
 
-    # fallback: if no intro found, use first 2 pages
-    if not intro_text.strip():
-        intro_text = "\n\n".join([f"[PAGE {p['page_number']}]\n{p['text']}" for p in pages[:2]])
+    intro_text = retrieve(index, INTRO_QUERY, max_chars=8000, boost_pages=intro_pages)
+    concl_text = retrieve(index, CONCLUSION_QUERY, max_chars=6000, boost_pages=concl_pages)
 
     return f"""
 ABSTRACT:
 {abstract}
 
 INTRODUCTION_TEXT:
-{intro_text[:8000]}
+{intro_text}
 
 CONCLUSION_DISCUSSION_LIMITATIONS_TEXT:
-{concl_text[:6000]}
+{concl_text}
 
 Return ONLY JSON in this format:
 {{
@@ -119,25 +115,26 @@ Constraints:
 - Do not hallucinate.
 """
 
-def extract_claims(input_json: str, output_json: str, model: str):
+def extract_claims(input_json: str, output_json: str, model: str | None = None, previous: dict | None = None,
+                   ctx: RunContext | None = None):
     if not os.path.exists(input_json):
         raise FileNotFoundError(f"Input JSON not found: {input_json}")
 
-    with open(input_json, "r", encoding="utf-8") as f:
-        data = json.load(f)
-
-    client = init()
+    data = load_document(input_json)
 
-    user_prompt = build_user_prompt(data)
+    index = load_or_build_index(data.get("pages", []), retrieval_cache_dir(input_json))
+    user_prompt = build_user_prompt(data, index)
+    fingerprint = prompt_fingerprint("extract_claims", SYSTEM_PROMPT, user_prompt, model)
 
-    extracted_claims = call_llm(
-        client=client,
-        system_prompt=SYSTEM_PROMPT,
-        user_prompt=user_prompt,
-        model=model
-    )
+    if not reuse_stage_output(data, previous, "extract_claims", fingerprint, ["claims"]):
+        extracted_claims = call_stage_llm(
+            stage="extract_claims",
+            system_prompt=SYSTEM_PROMPT,
+            user_prompt=user_prompt,
+            model=model,
+            ctx=ctx
+        )
 
-    data["claims"] = extracted_claims
+        data["claims"] = extracted_claims
 
-    with open(output_json, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
\ No newline at end of file
+    dump_document(data, output_json)
\ No newline at end of file
@@ -0,0 +1,406 @@
+import argparse
+import glob
+import hashlib
+import json
+import os
+import re
+import sqlite3
+from datetime import datetime
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS papers (
+    paper_id TEXT PRIMARY KEY,
+    title TEXT,
+    file_name TEXT,
+    abstract TEXT,
+    page_count INTEGER,
+    source_path TEXT,
+    ingested_at TEXT
+);
+
+CREATE TABLE IF NOT EXISTS sections (
+    paper_id TEXT NOT NULL,
+    section_id TEXT,
+    name TEXT,
+    start_page INTEGER,
+    end_page INTEGER
+);
+
+CREATE TABLE IF NOT EXISTS claims (
+    paper_id TEXT NOT NULL,
+    item_id TEXT,
+    kind TEXT,
+    type TEXT,
+    text TEXT,
+    page INTEGER
+);
+
+CREATE TABLE IF NOT EXISTS method_items (
+    paper_id TEXT NOT NULL,
+    kind TEXT,
+    name TEXT,
+    text TEXT,
+    page INTEGER
+);
+
+CREATE TABLE IF NOT EXISTS datasets (
+    paper_id TEXT NOT NULL,
+    name TEXT,
+    name_norm TEXT,
+    page INTEGER
+);
+
+CREATE TABLE IF NOT EXISTS metrics (
+    paper_id TEXT NOT NULL,
+    name TEXT,
+    name_norm TEXT,
+    page INTEGER
+);
+
+CREATE TABLE IF NOT EXISTS results (
+    paper_id TEXT NOT NULL,
+    dataset TEXT,
+    dataset_norm TEXT,
+    metric TEXT,
+    metric_norm TEXT,
+    baseline TEXT,
+    baseline_value REAL,
+    proposed_value REAL,
+    delta REAL,
+    page INTEGER
+);
+
+CREATE INDEX IF NOT EXISTS idx_sections_paper ON sections(paper_id);
+CREATE INDEX IF NOT EXISTS idx_claims_paper ON claims(paper_id);
+CREATE INDEX IF NOT EXISTS idx_method_paper ON method_items(paper_id);
+CREATE INDEX IF NOT EXISTS idx_datasets_paper ON datasets(paper_id);
+CREATE INDEX IF NOT EXISTS idx_datasets_name ON datasets(name_norm, paper_id);
+CREATE INDEX IF NOT EXISTS idx_metrics_paper ON metrics(paper_id);
+CREATE INDEX IF NOT EXISTS idx_metrics_name ON metrics(name_norm, paper_id);
+CREATE INDEX IF NOT EXISTS idx_results_paper ON results(paper_id);
+CREATE INDEX IF NOT EXISTS idx_results_metric_dataset ON results(metric_norm, dataset_norm);
+
+-- Free-text search over every ingested item
+CREATE VIRTUAL TABLE IF NOT EXISTS corpus_fts USING fts5(
+    text,
+    paper_id,
+    kind UNINDEXED
+);
+
+-- Token search for "metric on dataset" questions, e.g. BLEU on WMT14
+CREATE VIRTUAL TABLE IF NOT EXISTS results_fts USING fts5(
+    metric,
+    dataset,
+    paper_id,
+    result_rowid UNINDEXED
+);
+"""
+
+PAPER_TABLES = ["sections", "claims", "method_items", "datasets", "metrics", "results", "corpus_fts", "results_fts"]
+
+
+def normalize_name(name: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "", (name or "").lower())
+
+
+def connect(db_path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def paper_id_for(data: dict) -> str:
+    """
+    Hash of the paper's page content hashes, so re-ingesting the same PDF
+    replaces its rows while different PDFs never share an id. Documents without
+    page hashes fall back to the PDF's resolved path.
+    """
+    page_hashes = [page.get("content_hash") for page in data.get("pages", [])]
+    if page_hashes and all(page_hashes):
+        key = "|".join(page_hashes)
+    else:
+        key = os.path.realpath(data.get("source", {}).get("file_path", ""))
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+
+
+def trace_page(item: dict):
+    return (item.get("trace") or {}).get("page")
+
+
+def to_number(value):
+    return value if isinstance(value, (int, float)) and not isinstance(value, bool) else None
+
+
+def document_rows(data: dict, paper_id: str) -> dict:
+    """
+    Flatten one finished document into rows per table.
+    """
+    outline = data.get("outline", {})
+    claims = data.get("claims", {})
+    method = data.get("method", {})
+    experiments = data.get("experiments", {})
+
+    rows = {table: [] for table in PAPER_TABLES}
+
+    for sec in outline.get("sections", []):
+        rows["sections"].append((paper_id, sec.get("section_id"), sec.get("name"), sec.get("start_page"), sec.get("end_page")))
+
+    for kind in ("problem_statement", "motivation"):
+        item = claims.get(kind) or {}
+        if item.get("text"):
+            rows["claims"].append((paper_id, None, kind, None, item["text"], trace_page(item)))
+    for item in claims.get("contributions", []):
+        rows["claims"].append((paper_id, item.get("contribution_id"), "contribution", None, item.get("text"), trace_page(item)))
+    for item in claims.get("key_claims", []):
+        rows["claims"].append((paper_id, item.get("claim_id"), "key_claim", item.get("type"), item.get("text"), trace_page(item)))
+
+    for kind in ("high_level_summary", "core_idea"):
+        item = method.get(kind) or {}
+        if item.get("text"):
+            rows["method_items"].append((paper_id, kind, None, item["text"], trace_page(item)))
+    for item in method.get("step_by_step", []):
+        rows["method_items"].append((paper_id, "step", str(item.get("step")), item.get("text"), trace_page(item)))
+    for item in method.get("architecture_components", []):
+        rows["method_items"].append((paper_id, "component", item.get("name"), item.get("purpose"), trace_page(item)))
+    for item in method.get("equations", []):
+        rows["method_items"].append((paper_id, "equation", item.get("equation"), item.get("meaning"), trace_page(item)))
+
+    for table in ("datasets", "metrics"):
+        for item in experiments.get(table, []):
+            rows[table].append((paper_id, item.get("name"), normalize_name(item.get("name")), trace_page(item)))
+
+    for item in experiments.get("results", []):
+        rows["results"].append((
+            paper_id,
+            item.get("dataset"), normalize_name(item.get("dataset")),
+            item.get("metric"), normalize_name(item.get("metric")),
+            item.get("baseline"),
+            to_number(item.get("baseline_value")),
+            to_number(item.get("proposed_value")),
+            to_number(item.get("delta")),
+            trace_page(item)
+        ))
+
+    for kind, text in [("title", outline.get("title")), ("abstract", outline.get("abstract"))]:
+        if text:
+            rows["corpus_fts"].append((text, paper_id, kind))
+    for row in rows["claims"]:
+        if row[4]:
+            rows["corpus_fts"].append((row[4], paper_id, row[2]))
+    for row in rows["method_items"]:
+        text = " ".join(t for t in (row[2], row[3]) if t)
+        if text:
+            rows["corpus_fts"].append((text, paper_id, row[1]))
+    for table, kind in (("datasets", "dataset"), ("metrics", "metric")):
+        for row in rows[table]:
+            if row[1]:
+                rows["corpus_fts"].append((row[1], paper_id, kind))
+
+    return rows
+
+
+INSERT_SQL = {
+    "sections": "INSERT INTO sections VALUES (?, ?, ?, ?, ?)",
+    "claims": "INSERT INTO claims VALUES (?, ?, ?, ?, ?, ?)",
+    "method_items": "INSERT INTO method_items VALUES (?, ?, ?, ?, ?)",
+    "datasets": "INSERT INTO datasets VALUES (?, ?, ?, ?)",
+    "metrics": "INSERT INTO metrics VALUES (?, ?, ?, ?)",
+    "corpus_fts": "INSERT INTO corpus_fts (text, paper_id, kind) VALUES (?, ?, ?)"
+}
+
+
+def delete_paper_rows(conn: sqlite3.Connection, paper_id: str):
+    for table in PAPER_TABLES:
+        if table.endswith("_fts"):
+            # paper_id is an indexed FTS column, so this is a token lookup, not a scan
+            conn.execute(
+                f"DELETE FROM {table} WHERE rowid IN (SELECT rowid FROM {table} WHERE {table} MATCH ?)",
+                (f"paper_id : {fts_phrase(paper_id)}",)
+            )
+        else:
+            conn.execute(f"DELETE FROM {table} WHERE paper_id = ?", (paper_id,))
+
+
+RESULTS_INSERT_SQL = "INSERT INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+
+
+def ingest_documents(conn: sqlite3.Connection, documents: list) -> int:
+    """
+    Ingest [(source_path, data), ...] in a single transaction.
+    Re-ingesting a paper replaces its previous rows.
+    """
+    ingested_at = datetime.utcnow().isoformat() + "Z"
+
+    with conn:
+        for source_path, data in documents:
+            paper_id = paper_id_for(data)
+            outline = data.get("outline", {})
+            source = data.get("source", {})
+
+            if conn.execute("SELECT 1 FROM papers WHERE paper_id = ?", (paper_id,)).fetchone():
+                delete_paper_rows(conn, paper_id)
+
+            conn.execute(
+                "INSERT OR REPLACE INTO papers VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (paper_id, outline.get("title"), source.get("file_name"), outline.get("abstract"),
+                 source.get("page_count"), source_path, ingested_at)
+            )
+
+            rows = document_rows(data, paper_id)
+            for table, sql in INSERT_SQL.items():
+                if rows[table]:
+                    conn.executemany(sql, rows[table])
+
+            # Results are inserted one by one to link each FTS row to its rowid
+            for row in rows["results"]:
+                rowid = conn.execute(RESULTS_INSERT_SQL, row).lastrowid
+                conn.execute(
+                    "INSERT INTO results_fts (metric, dataset, paper_id, result_rowid) VALUES (?, ?, ?, ?)",
+                    (row[3] or "", row[1] or "", paper_id, rowid)
+                )
+
+    return len(documents)
+
+
+def ingest_files(conn: sqlite3.Connection, paths: list, batch_size: int = 500) -> int:
+    """
+    Bulk-ingest finished documents (files, or directories searched for output_s6.json).
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(os.path.join(path, "**", "output_s6.json"), recursive=True)))
+        else:
+            files.append(path)
+
+    total = 0
+    for start in range(0, len(files), batch_size):
+        documents = []
+        for path in files[start:start + batch_size]:
+            with open(path, "r", encoding="utf-8") as f:
+                documents.append((os.path.abspath(path), json.load(f)))
+        total += ingest_documents(conn, documents)
+        print(f"Ingested: [{total}/{len(files)}]")
+
+    return total
+
+
+def fts_phrase(text: str) -> str:
+    return '"' + text.replace('"', '""') + '"'
+
+
+def papers_reporting(conn: sqlite3.Connection, metric: str, dataset: str | None = None) -> list:
+    """
+    Result rows whose metric (and dataset, if given) match, e.g. BLEU on WMT14.
+    Exact normalized names use the B-tree index; token matches fall back to FTS.
+    """
+    params = [normalize_name(metric)]
+    where = "r.metric_norm = ?"
+    if dataset:
+        where += " AND r.dataset_norm = ?"
+        params.append(normalize_name(dataset))
+
+    rows = conn.execute(
+        f"""
+        SELECT p.paper_id, p.title, r.dataset, r.metric, r.baseline,
+               r.baseline_value, r.proposed_value, r.delta, r.page
+        FROM results r JOIN papers p ON p.paper_id = r.paper_id
+        WHERE {where}
+        """,
+        params
+    ).fetchall()
+
+    query = f"metric : {fts_phrase(metric)}"
+    if dataset:
+        query += f" AND dataset : {fts_phrase(dataset)}"
+
+    rows += conn.execute(
+        """
+        SELECT p.paper_id, p.title, r.dataset, r.metric, r.baseline,
+               r.baseline_value, r.proposed_value, r.delta, r.page
+        FROM results_fts f
+        JOIN results r ON r.rowid = f.result_rowid
+        JOIN papers p ON p.paper_id = r.paper_id
+        WHERE results_fts MATCH ?
+        """,
+        (query,)
+    ).fetchall()
+
+    unique = {}
+    for row in rows:
+        unique.setdefault(tuple(row), dict(row))
+    return list(unique.values())
+
+
+def papers_using_dataset(conn: sqlite3.Connection, dataset: str) -> list:
+    rows = conn.execute(
+        """
+        SELECT DISTINCT p.paper_id, p.title
+        FROM datasets d JOIN papers p ON p.paper_id = d.paper_id
+        WHERE d.name_norm = ?
+        """,
+        (normalize_name(dataset),)
+    ).fetchall()
+    return [dict(row) for row in rows]
+
+
+def fts_query(text: str) -> str:
+    """
+    User text as an FTS5 expression: each whitespace-separated token becomes a
+    quoted phrase, so hyphens (En-De, GPT-4) and apostrophes are matched as
+    text instead of parsed as column filters or syntax.
+    """
+    return " ".join(fts_phrase(token) for token in text.split())
+
+
+def search(conn: sqlite3.Connection, query: str, limit: int = 20) -> list:
+    expression = fts_query(query)
+    if not expression:
+        return []
+
+    rows = conn.execute(
+        """
+        SELECT f.paper_id, p.title, f.kind, snippet(corpus_fts, 0, '[', ']', '...', 12) AS snippet
+        FROM corpus_fts f JOIN papers p ON p.paper_id = f.paper_id
+        WHERE corpus_fts MATCH ?
+        ORDER BY rank
+        LIMIT ?
+        """,
+        (f"text : ({expression})", limit)
+    ).fetchall()
+    return [dict(row) for row in rows]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cross-paper corpus index.")
+    parser.add_argument("db", help="SQLite database path")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    ingest_cmd = commands.add_parser("ingest", help="ingest finished documents")
+    ingest_cmd.add_argument("paths", nargs="+")
+
+    results_cmd = commands.add_parser("results", help="papers reporting a metric, optionally on a dataset")
+    results_cmd.add_argument("--metric", required=True)
+    results_cmd.add_argument("--dataset")
+
+    search_cmd = commands.add_parser("search", help="FTS5 search over claims, method and datasets")
+    search_cmd.add_argument("query")
+    search_cmd.add_argument("--limit", type=int, default=20)
+
+    args = parser.parse_args()
+    conn = connect(args.db)
+
+    if args.command == "ingest":
+        ingest_files(conn, args.paths)
+    elif args.command == "results":
+        for row in papers_reporting(conn, args.metric, args.dataset):
+            print(json.dumps(row, ensure_ascii=False))
+    else:
+        for row in search(conn, args.query, args.limit):
+            print(json.dumps(row, ensure_ascii=False))
+
+    conn.close()
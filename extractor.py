@@ -1,22 +1,31 @@
 import fitz
+import hashlib
 import json
 import os
 import re
 import sys
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+from figures import MAX_KEY_FIGURES, image_bboxes, link_figure_captions, render_key_figure, select_key_figures
+from line_scanner import scan_lines
+from ocr import OCR_MIN_CHARS, low_text_pages, ocr_pages, tesseract_path
+from page_store import page_text
 
 
-CAPTION_REGEX = re.compile(r"^(Figure|Fig\.|Table)\s+\d+[:\.]?\s+.*", re.IGNORECASE)
-
-
-def extract_captions_from_text(page_text: str, page_number: int):
+def extract_captions_from_text(page_text: str, page_number: int, line_classes: list | None = None):
     captions = []
+    if line_classes is not None and not any(c == "caption" for _, c in line_classes):
+        return captions
+
     lines = [line.strip() for line in page_text.split("\n") if line.strip()]
+    if line_classes is None:
+        line_classes = scan_lines(lines)
 
     caption_id_counter = 1
 
-    for line in lines:
-        if CAPTION_REGEX.match(line):
+    for line_index, line_class in line_classes:
+        if line_class == "caption":
+            line = lines[line_index]
             cap_type = "figure" if line.lower().startswith(("figure", "fig")) else "table"
 
             captions.append({
@@ -30,7 +39,190 @@ def extract_captions_from_text(page_text: str, page_number: int):
     return captions
 
 
-def extract_pdf(pdf_path: str, output_dir: str = "output"):
+def clean_cell(cell) -> str:
+    return re.sub(r"\s+", " ", cell or "").strip()
+
+
+def locate_captions(page, captions):
+    located = []
+    for cap in captions:
+        rects = page.search_for(cap["text"][:80])
+        if rects:
+            located.append((cap, rects[0]))
+    return located
+
+
+def link_table_captions(page, tables, captions):
+    """
+    Pair each table with the nearest unused table caption on the same page,
+    by vertical distance. Falls back to reading order when captions can't be located.
+    """
+    table_captions = [c for c in captions if c["type"] == "table"]
+    located = locate_captions(page, table_captions)
+    links = [None] * len(tables)
+    used = set()
+
+    if located:
+        for idx, table in enumerate(tables):
+            rect = fitz.Rect(table.bbox)
+            candidates = [
+                (min(abs(cap_rect.y1 - rect.y0), abs(cap_rect.y0 - rect.y1)), cap["caption_id"])
+                for cap, cap_rect in located
+                if cap["caption_id"] not in used
+            ]
+            if candidates:
+                links[idx] = min(candidates)[1]
+                used.add(links[idx])
+    else:
+        for idx, cap in enumerate(table_captions[:len(tables)]):
+            links[idx] = cap["caption_id"]
+
+    return links
+
+
+def extract_tables_from_page(page, page_number: int, captions):
+    if not hasattr(page, "find_tables"):
+        return [], None
+
+    tables = page.find_tables().tables
+    if not tables:
+        return [], None
+
+    caption_links = link_table_captions(page, tables, captions)
+    tables_data = []
+
+    for idx, table in enumerate(tables):
+        rows = [[clean_cell(c) for c in row] for row in table.extract()]
+        rows = [row for row in rows if any(row)]
+        if not rows:
+            continue
+
+        header = [clean_cell(name) for name in table.header.names] if table.header else []
+        if header and rows[0] == header:
+            rows = rows[1:]
+
+        tables_data.append({
+            "table_id": f"TAB_P{page_number}_{idx + 1}",
+            "page_number": page_number,
+            "caption_id": caption_links[idx],
+            "bbox": [round(v, 1) for v in table.bbox],
+            "header": header,
+            "rows": rows
+        })
+
+    # Page text with table regions removed, so table cells aren't sent twice
+    table_rects = [fitz.Rect(t.bbox) for t in tables]
+    blocks = page.get_text("blocks") or []
+    text_without_tables = "\n".join(
+        b[4].strip() for b in blocks
+        if b[6] == 0 and not any(fitz.Rect(b[:4]).intersects(r) for r in table_rects)
+    ).strip()
+
+    return tables_data, text_without_tables
+
+
+def extract_tables_worker(pdf_path: str, page_indices: list):
+    doc = fitz.open(pdf_path)
+    results = []
+
+    for page_index in page_indices:
+        page_number = page_index + 1
+        page = doc.load_page(page_index)
+        text = (page.get_text("text") or "").strip()
+        captions = extract_captions_from_text(text, page_number)
+        results.append((page_index, *extract_tables_from_page(page, page_number, captions)))
+
+    doc.close()
+    return results
+
+
+def extract_tables(pdf_path: str, page_indices: list, max_workers: int | None = None):
+    """
+    Run PyMuPDF's table finder over the given pages, in parallel chunks of pages.
+    Each worker opens its own document handle since fitz documents can't be shared.
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    max_workers = min(max_workers, len(page_indices))
+
+    if max_workers <= 1:
+        return extract_tables_worker(pdf_path, page_indices)
+
+    chunks = [page_indices[i::max_workers] for i in range(max_workers)]
+    results = []
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        for chunk_results in executor.map(extract_tables_worker, [pdf_path] * len(chunks), chunks):
+            results.extend(chunk_results)
+
+    return sorted(results, key=lambda r: r[0])
+
+
+def page_content_hash(doc, page, text: str) -> str:
+    """
+    Hash of a page's text plus the raw streams of its images, so pages can be
+    matched across versions of a paper even if they move.
+    """
+    digest = hashlib.sha256(text.encode("utf-8"))
+    for img in page.get_images(full=True):
+        digest.update(b"\0")
+        digest.update(hashlib.sha256(doc.xref_stream_raw(img[0]) or b"").digest())
+    return digest.hexdigest()
+
+
+def index_previous_pages(previous: dict | None, output_dir: str) -> dict:
+    """
+    Map content_hash -> reusable records of a previous extraction.
+    Pages whose figure assets no longer exist are not reusable.
+    """
+    if not previous:
+        return {}
+
+    by_page = {}
+    for page in previous.get("pages", []):
+        if page.get("content_hash"):
+            by_page[page["page_number"]] = {"page": page, "figures": [], "tables": []}
+
+    for fig in previous.get("figures", []):
+        if fig["page_number"] in by_page:
+            by_page[fig["page_number"]]["figures"].append(fig)
+    for table in previous.get("tables_raw", []):
+        if table["page_number"] in by_page:
+            by_page[table["page_number"]]["tables"].append(table)
+
+    reusable = {}
+    for record in by_page.values():
+        if all(os.path.exists(os.path.join(output_dir, f["image_path"])) for f in record["figures"]):
+            reusable[record["page"]["content_hash"]] = record
+    return reusable
+
+
+def unique_asset_filename(filename: str, reserved: set) -> str:
+    stem, ext = os.path.splitext(filename)
+    candidate, n = filename, 2
+    while f"assets/{candidate}" in reserved:
+        candidate = f"{stem}_v{n}{ext}"
+        n += 1
+    return candidate
+
+
+def apply_ocr_text(page_data: dict, text: str):
+    page_data["text"] = text
+    page_data["char_count"] = len(text)
+    page_data["word_count"] = len(text.split()) if text else 0
+    page_data["line_classes"] = scan_lines([ln.strip() for ln in text.split("\n") if ln.strip()])
+    page_data["text_source"] = "ocr"
+
+
+def extract_pdf(pdf_path: str, output_dir: str = "output", max_workers: int | None = None, previous: dict | None = None,
+                ocr: bool = True, render_key_figures: bool = False):
+    """
+    Extract pages, captions, figures and tables from a PDF.
+    With a previous extraction (e.g. of an earlier arXiv version), pages whose
+    content_hash is unchanged reuse its figure assets and tables.
+    Pages with almost no text layer (scans) are OCRed with Tesseract when it is
+    installed; OCR text is cached under output_dir/cache/ocr by rendered page hash.
+    Figures are paired with their captions by position; with render_key_figures,
+    the few most referenced figures are rendered downscaled for vision input.
+    """
     if not os.path.exists(pdf_path):
         raise FileNotFoundError(f"PDF file not found: {pdf_path}")
 
@@ -45,33 +237,70 @@ def extract_pdf(pdf_path: str, output_dir: str = "output"):
     figures_data = []
     captions_data = []
 
+    tables_by_page = {}
+    page_sizes = {}
+
     figure_counter = 1
 
+    previous_pages = index_previous_pages(previous, output_dir)
+    reserved_assets = {f["image_path"] for r in previous_pages.values() for f in r["figures"]}
+    changed_page_indices = []
+
     for page_index in range(doc.page_count):
         page_number = page_index + 1
         page = doc.load_page(page_index)
+        page_sizes[page_number] = (page.rect.width, page.rect.height)
 
         text = page.get_text("text") or ""
         text = text.strip()
 
         char_count = len(text)
         word_count = len(text.split()) if text else 0
+        content_hash = page_content_hash(doc, page, text)
+        line_classes = scan_lines([ln.strip() for ln in text.split("\n") if ln.strip()])
 
         pages_data.append({
             "page_id": f"P{page_number}",
             "page_number": page_number,
             "text": text,
             "char_count": char_count,
-            "word_count": word_count
+            "word_count": word_count,
+            "content_hash": content_hash,
+            "line_classes": line_classes
         })
 
         all_text_parts.append(text)
 
         # Extract captions from this page
-        captions_data.extend(extract_captions_from_text(text, page_number))
+        captions_data.extend(extract_captions_from_text(text, page_number, line_classes))
+
+        reused = previous_pages.get(content_hash)
+        if reused:
+            for fig in reused["figures"]:
+                figures_data.append({**fig, "figure_id": f"FIG{figure_counter}", "page_number": page_number})
+                figure_counter += 1
+
+            # Caption ids are per page, so re-key the reused tables' links
+            old_prefix = f"CAP_P{reused['page']['page_number']}_"
+            tables_by_page[page_index] = [
+                {
+                    **table,
+                    "table_id": f"TAB_P{page_number}_{idx + 1}",
+                    "page_number": page_number,
+                    "caption_id": table["caption_id"].replace(old_prefix, f"CAP_P{page_number}_", 1) if table.get("caption_id") else None
+                }
+                for idx, table in enumerate(reused["tables"])
+            ]
+            if reused["tables"]:
+                # Read now: the previous page store may be rewritten by this run
+                pages_data[-1]["text_without_tables"] = page_text(reused["page"], "text_without_tables")
+            continue
+
+        changed_page_indices.append(page_index)
 
         # Extract embedded images
         image_list = page.get_images(full=True)
+        placements = image_bboxes(page) if image_list else {}
 
         for img_index, img in enumerate(image_list):
             xref = img[0]
@@ -80,7 +309,7 @@ def extract_pdf(pdf_path: str, output_dir: str = "output"):
             image_bytes = base_image["image"]
             image_ext = base_image["ext"]
 
-            image_filename = f"fig_page{page_number}_{figure_counter}.{image_ext}"
+            image_filename = unique_asset_filename(f"fig_page{page_number}_{figure_counter}.{image_ext}", reserved_assets)
             image_path = os.path.join(assets_dir, image_filename)
 
             with open(image_path, "wb") as f:
@@ -91,23 +320,67 @@ def extract_pdf(pdf_path: str, output_dir: str = "output"):
                 "page_number": page_number,
                 "image_path": f"assets/{image_filename}",
                 "width": base_image.get("width"),
-                "height": base_image.get("height")
+                "height": base_image.get("height"),
+                # An image drawn several times is listed once per placement
+                "bbox": placements[xref].pop(0) if placements.get(xref) else None
             })
 
             figure_counter += 1
 
-    # full_text = "\n\n".join([t for t in all_text_parts if t])
+    for page_index, page_tables, text_without_tables in extract_tables(pdf_path, changed_page_indices, max_workers):
+        tables_by_page[page_index] = page_tables
+        if page_tables:
+            pages_data[page_index]["text_without_tables"] = text_without_tables
+
+    tables_data = [table for page_index in sorted(tables_by_page) for table in tables_by_page[page_index]]
+
+    warnings = []
+
+    # OCR fallback for scanned pages
+    ocr_page_indices = low_text_pages(pages_data) if ocr else []
+    ocr_texts = {}
+    if ocr_page_indices:
+        if tesseract_path():
+            print(f"OCR: {len(ocr_page_indices)} page(s) with under {OCR_MIN_CHARS} characters of text.")
+            ocr_texts, ocr_errors = ocr_pages(pdf_path, ocr_page_indices, os.path.join(output_dir, "cache", "ocr"), max_workers)
+            for page_index, error in sorted(ocr_errors.items()):
+                warnings.append(f"OCR failed on page {pages_data[page_index]['page_number']} ({error}); kept its text layer.")
+        else:
+            warnings.append(f"{len(ocr_page_indices)} page(s) have no text layer and tesseract is not installed; OCR skipped.")
+
+    for page_index, text in sorted(ocr_texts.items()):
+        if len(text) <= pages_data[page_index]["char_count"]:
+            continue
+        page_data = pages_data[page_index]
+        apply_ocr_text(page_data, text)
+        all_text_parts[page_index] = text
+        captions_data = [c for c in captions_data if c["page_number"] != page_data["page_number"]]
+        captions_data.extend(extract_captions_from_text(text, page_data["page_number"], page_data["line_classes"]))
+
+    captions_data.sort(key=lambda c: c["page_number"])
+
+    link_figure_captions(doc, figures_data, captions_data)
+    key_figures = select_key_figures(figures_data, captions_data, pages_data, page_sizes, MAX_KEY_FIGURES)
+
+    if render_key_figures:
+        key_figures = [render_key_figure(doc.load_page(kf["page_number"] - 1), kf, assets_dir) for kf in key_figures]
+
+    full_text = "\n\n".join([t for t in all_text_parts if t])
+
+    if not full_text.strip():
+        warnings.append("No extractable text found in PDF.")
 
     # Extraction notes
     extraction_notes = {
+        "has_text": bool(full_text.strip()),
         "has_images": len(figures_data) > 0,
         "has_captions": len(captions_data) > 0,
-        "warnings": []
+        "has_tables": len(tables_data) > 0,
+        "reused_pages": doc.page_count - len(changed_page_indices) if previous else 0,
+        "ocr_pages": [pages_data[i]["page_number"] for i in sorted(ocr_texts) if pages_data[i].get("text_source") == "ocr"],
+        "warnings": warnings
     }
 
-    # if not full_text.strip():
-    #     extraction_notes["warnings"].append("No extractable text found in PDF.")
-
     result = {
         "schema_version": "paper-extract-v1",
         "source": {
@@ -124,8 +397,9 @@ def extract_pdf(pdf_path: str, output_dir: str = "output"):
         },
         "pages": pages_data,
         "figures": figures_data,
-        "tables_raw": [],
+        "tables_raw": tables_data,
         "captions": captions_data,
+        "key_figures": key_figures,
         "extraction_notes": extraction_notes
     }
 
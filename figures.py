@@ -0,0 +1,243 @@
+import base64
+import fitz
+import os
+import re
+from bisect import bisect_left
+from collections import Counter
+from page_store import page_text
+
+
+# Captions further than this fraction of the page height from a figure are not paired
+MAX_CAPTION_GAP_FRACTION = 0.5
+
+# Figures (or groups of sub-figures) smaller than this fraction of the page are
+# logos, icons or equation images and never key figures
+MIN_KEY_FIGURE_AREA_FRACTION = 0.02
+
+MAX_KEY_FIGURES = 4
+
+# Longest side of a key figure render, in pixels
+KEY_FIGURE_MAX_SIDE = 1024
+
+FIGURE_NUMBER_REGEX = re.compile(r"\b(?:figure|fig\.?)\s*(\d+)", re.IGNORECASE)
+
+
+def image_bboxes(page) -> dict:
+    """
+    xref -> bboxes where the image is drawn on the page, in drawing order, from
+    one pass over the page rather than a get_image_rects() call per image.
+    """
+    bboxes = {}
+    for info in page.get_image_info(xrefs=True):
+        if info.get("xref"):
+            bboxes.setdefault(info["xref"], []).append([round(v, 1) for v in info["bbox"]])
+    return bboxes
+
+
+def caption_bboxes(page, captions: list) -> dict:
+    """
+    caption_id -> bbox of the text block containing each caption's first line.
+    """
+    blocks = [(" ".join(b[4].split()), b[:4]) for b in page.get_text("blocks") or [] if b[6] == 0]
+    bboxes = {}
+
+    for cap in captions:
+        key = " ".join(cap["text"].split())[:60]
+        for text, rect in blocks:
+            if key in text:
+                bboxes[cap["caption_id"]] = [round(v, 1) for v in rect]
+                break
+
+    return bboxes
+
+
+def overlaps_horizontally(a: list, b: list) -> bool:
+    return a[0] < b[2] and b[0] < a[2]
+
+
+class CaptionIndex:
+    """
+    One page's figure captions sorted by top edge. The caption below a figure is
+    found by bisecting on the figure's bottom edge and walking down, the caption
+    above by walking up, so pairing stays O(log n) per figure on image-heavy pages.
+    """
+
+    def __init__(self, captions: list, max_gap: float):
+        # captions: [(caption_id, bbox), ...]
+        self.entries = sorted(captions, key=lambda c: c[1][1])
+        self.tops = [bbox[1] for _, bbox in self.entries]
+        self.max_height = max((bbox[3] - bbox[1] for _, bbox in self.entries), default=0)
+        self.max_gap = max_gap
+
+    def below(self, bbox: list) -> tuple | None:
+        # Small overlap allowed: image bboxes often include a few points of padding
+        start = bisect_left(self.tops, bbox[3] - 2)
+        for caption_id, cap_bbox in self.entries[start:]:
+            gap = cap_bbox[1] - bbox[3]
+            if gap > self.max_gap:
+                break
+            if overlaps_horizontally(bbox, cap_bbox):
+                return max(gap, 0), caption_id
+        return None
+
+    def above(self, bbox: list) -> tuple | None:
+        best = None
+        end = bisect_left(self.tops, bbox[1])
+        for caption_id, cap_bbox in reversed(self.entries[:end]):
+            if bbox[1] - cap_bbox[1] > self.max_gap + self.max_height:
+                break
+            gap = bbox[1] - cap_bbox[3]
+            if -2 <= gap <= self.max_gap and overlaps_horizontally(bbox, cap_bbox):
+                if best is None or gap < best[0]:
+                    best = (max(gap, 0), caption_id)
+        return best
+
+    def nearest(self, bbox: list) -> str | None:
+        """
+        Caption for a figure: the nearest one below it (the usual placement),
+        else the nearest one above it.
+        """
+        match = self.below(bbox) or self.above(bbox)
+        return match[1] if match else None
+
+
+def link_figure_captions(doc, figures: list, captions: list):
+    """
+    Set bbox on figure captions and caption_id on figures, page by page.
+    Only pages with both placed figures and figure captions are read again.
+    """
+    figures_by_page = {}
+    for fig in figures:
+        fig["caption_id"] = None
+        if fig.get("bbox"):
+            figures_by_page.setdefault(fig["page_number"], []).append(fig)
+
+    captions_by_page = {}
+    for cap in captions:
+        if cap["type"] == "figure" and cap["page_number"] in figures_by_page:
+            captions_by_page.setdefault(cap["page_number"], []).append(cap)
+
+    for page_number, page_captions in captions_by_page.items():
+        page = doc.load_page(page_number - 1)
+        bboxes = caption_bboxes(page, page_captions)
+        for cap in page_captions:
+            if cap["caption_id"] in bboxes:
+                cap["bbox"] = bboxes[cap["caption_id"]]
+
+        index = CaptionIndex(list(bboxes.items()), page.rect.height * MAX_CAPTION_GAP_FRACTION)
+        for fig in figures_by_page[page_number]:
+            fig["caption_id"] = index.nearest(fig["bbox"])
+
+
+def union_bbox(bboxes: list) -> list:
+    return [
+        min(b[0] for b in bboxes),
+        min(b[1] for b in bboxes),
+        max(b[2] for b in bboxes),
+        max(b[3] for b in bboxes)
+    ]
+
+
+def figure_mentions(pages: list) -> Counter:
+    """
+    How often each figure number is referred to in the text ("Figure 3", "Fig. 3").
+    """
+    mentions = Counter()
+    for page in pages:
+        mentions.update(FIGURE_NUMBER_REGEX.findall(page_text(page)))
+    return mentions
+
+
+def select_key_figures(figures: list, captions: list, pages: list, page_sizes: dict,
+                       max_figures: int = MAX_KEY_FIGURES) -> list:
+    """
+    Pick the figures worth showing to a vision model from metadata alone:
+    captioned figures (sub-figures sharing a caption are grouped), large enough
+    to matter, ranked by how often the text refers to them, then by size.
+    Returned in page order.
+    """
+    caption_by_id = {c["caption_id"]: c for c in captions}
+    groups = {}
+    for fig in figures:
+        if fig.get("caption_id") in caption_by_id and fig.get("bbox"):
+            groups.setdefault(fig["caption_id"], []).append(fig)
+    if not groups:
+        return []
+
+    mentions = figure_mentions(pages)
+    candidates = []
+
+    for caption_id, group in groups.items():
+        caption = caption_by_id[caption_id]
+        page_width, page_height = page_sizes[caption["page_number"]]
+        bbox = union_bbox([f["bbox"] for f in group])
+        area = (bbox[2] - bbox[0]) * (bbox[3] - bbox[1]) / (page_width * page_height)
+        if area < MIN_KEY_FIGURE_AREA_FRACTION:
+            continue
+
+        number = FIGURE_NUMBER_REGEX.match(caption["text"])
+        # The caption itself counts as one mention
+        referenced = max(mentions[number.group(1)] - 1, 0) if number else 0
+
+        candidates.append({
+            "caption_id": caption_id,
+            "figure_ids": [f["figure_id"] for f in group],
+            "page_number": caption["page_number"],
+            "bbox": bbox,
+            "mentions": referenced,
+            "area_fraction": round(area, 3)
+        })
+
+    candidates.sort(key=lambda c: (-c["mentions"], -c["area_fraction"]))
+    selected = candidates[:max_figures]
+    return sorted(selected, key=lambda c: (c["page_number"], c["bbox"][1]))
+
+
+def render_key_figure(page, key_figure: dict, assets_dir: str, max_side: int = KEY_FIGURE_MAX_SIDE) -> dict:
+    """
+    Render the page region of a key figure, downscaled so its longest side is at
+    most max_side pixels. Rendering the region rather than copying the embedded
+    image keeps vector labels and axes drawn over it.
+    """
+    clip = fitz.Rect(key_figure["bbox"]) & page.rect
+    zoom = min(max_side / max(clip.width, clip.height, 1), 2.0)
+    pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), clip=clip)
+
+    filename = f"key_{key_figure['caption_id']}.png"
+    pix.save(os.path.join(assets_dir, filename))
+
+    return {**key_figure, "image_path": f"assets/{filename}", "width": pix.width, "height": pix.height}
+
+
+def format_key_figures(data: dict) -> str:
+    """
+    Text listing of the rendered key figures, in the order they are attached.
+    """
+    caption_text = {c["caption_id"]: c["text"] for c in data.get("captions", [])}
+    lines = [
+        f"[IMAGE {i} | PAGE {kf['page_number']}] {caption_text.get(kf['caption_id'], '')}".strip()
+        for i, kf in enumerate(rendered_key_figures(data), start=1)
+    ]
+    return "\n".join(lines)
+
+
+def rendered_key_figures(data: dict) -> list:
+    return [kf for kf in data.get("key_figures", []) if kf.get("image_path")]
+
+
+def with_key_figure_images(user_prompt: str, data: dict, base_dir: str) -> str | list:
+    """
+    Chat message content with the rendered key figures attached after the text,
+    or the plain prompt when there are none.
+    """
+    content = [{"type": "text", "text": user_prompt}]
+
+    for kf in rendered_key_figures(data):
+        path = os.path.join(base_dir, kf["image_path"])
+        if not os.path.exists(path):
+            continue
+        with open(path, "rb") as f:
+            encoded = base64.b64encode(f.read()).decode("ascii")
+        content.append({"type": "image_url", "image_url": {"url": f"data:image/png;base64,{encoded}", "detail": "low"}})
+
+    return content if len(content) > 1 else user_prompt
@@ -1,7 +1,13 @@
 import json
 import os
+import re
 import sys
-from ai_integration import init, call_llm
+from concurrent.futures import ThreadPoolExecutor
+from incremental import prompt_fingerprint, reuse_stage_output
+from model_routing import FALLBACK_ERRORS, call_stage_llm
+from page_store import dump_document, load_document
+from run_context import RunContext
+from traces import compact_traces
 
 
 SYSTEM_PROMPT = """
@@ -20,20 +26,119 @@ Rules:
 - Output must be valid JSON only.
 """
 
-
-def build_user_prompt(data: dict) -> str:
+# Report template in its fixed order: (heading, body placeholder shown to the model)
+REPORT_SECTIONS = [
+    ("## TL;DR (max 5 lines)", "..."),
+    ("## 1. What problem does this paper solve?", "..."),
+    ("## 2. Why is this problem hard?", "..."),
+    ("## 3. What is the main contribution?", "..."),
+    ("## 4. Core idea (intuitive explanation)", "..."),
+    ("## 5. How the method works (step-by-step)", "1. ...\n2. ..."),
+    ("## 6. Architecture / Components", "- **Component**: purpose"),
+    ("## 7. Experiments and Results (What matters)", "..."),
+    ("## 8. What do the results actually prove?", "..."),
+    ("## 9. Limitations / Assumptions", "..."),
+    ("## 10. Practical takeaways (for engineers)", "..."),
+    ("## Glossary (simple definitions)", "- Term: meaning"),
+    ("## Skeptical reviewer notes", "...")
+]
+
+# Sectioned mode: each group is one independent call over the same input
+SECTION_GROUPS = {
+    "problem_idea": REPORT_SECTIONS[0:5],
+    "method_architecture": REPORT_SECTIONS[5:7],
+    "results_limitations": REPORT_SECTIONS[7:11],
+    "glossary_reviewer_notes": REPORT_SECTIONS[11:13]
+}
+
+# Extra attempts for a group whose response is missing sections
+GROUP_RETRIES = 2
+
+HEADING_REGEX = re.compile(r"^(#{1,2}) (.+?)\s*$", re.MULTILINE)
+
+
+def format_template(sections: list) -> str:
+    return "\n\n".join(f"{heading}\n{placeholder}" for heading, placeholder in sections)
+
+
+def normalize_section_heading(heading: str) -> str:
+    return re.sub(r"\s+", " ", heading.lstrip("#").strip()).lower()
+
+
+def heading_key(heading: str) -> str:
+    """
+    Lenient key for matching a model's heading to the template: the section
+    number if it has one ("1.", "1)", "Section 1:"), else the heading text
+    before any parenthetical, without trailing punctuation.
+    """
+    normalized = normalize_section_heading(heading)
+    number = re.match(r"^(?:section\s*)?(\d+)\s*[.):]", normalized)
+    if number:
+        return number.group(1)
+    return normalized.split("(")[0].strip(" :.-")
+
+
+def match_template_sections(sections: dict, expected: list) -> dict:
+    """
+    {expected normalized heading: body} for the expected headings found in
+    sections (from split_report_sections), matched by heading_key or, for
+    unnumbered headings, by prefix (e.g. "Glossary of terms").
+    """
+    keys = [(heading_key(h), body) for h, body in sections.items() if h and body]
+    matched = {}
+
+    for heading in expected:
+        key = heading_key(heading)
+        for candidate, body in keys:
+            if candidate == key or (not key.isdigit() and candidate.startswith(key)):
+                matched[heading] = body
+                break
+
+    return matched
+
+
+def split_report_sections(markdown: str) -> dict:
+    """
+    Split a markdown report into {normalized "## " heading: body}, in document
+    order. Text before the first "## " heading (the title) is under "".
+    """
+    sections = {}
+    matches = [m for m in HEADING_REGEX.finditer(markdown) if m.group(1) == "##"]
+
+    sections[""] = markdown[:matches[0].start()].strip() if matches else markdown.strip()
+    for i, match in enumerate(matches):
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(markdown)
+        sections[normalize_section_heading(match.group(2))] = markdown[match.end():end].strip()
+
+    return sections
+
+
+def assemble_report(title: str, section_bodies: dict) -> str:
+    """
+    Join section bodies ({normalized heading: body}) in template order.
+    """
+    parts = [f"# {title}"]
+    for heading, _ in REPORT_SECTIONS:
+        parts.append(f"{heading}\n{section_bodies[normalize_section_heading(heading)]}")
+    return "\n\n".join(parts)
+
+
+def report_title(data: dict) -> str:
+    return data.get("outline", {}).get("title") or data.get("source", {}).get("file_name", "Unknown Paper")
+
+
+def build_input_block(data: dict) -> str:
     outline = data.get("outline", {})
-    claims = data.get("claims", {})
-    method = data.get("method", {})
-    experiments = data.get("experiments", {})
-
-    title = outline.get("title") or data.get("source", {}).get("file_name", "Unknown Paper")
+    # The report is written from the items themselves; trace snippets only cost tokens here
+    claims = compact_traces(data.get("claims", {}))
+    method = compact_traces(data.get("method", {}))
+    experiments = compact_traces(data.get("experiments", {}))
 
     return f"""
 You are given extracted structured data from a research paper.
 
 PAPER_TITLE:
-{title}
+{report_title(data)}
 
 ABSTRACT:
 {outline.get("abstract", "")}
@@ -46,7 +151,13 @@ METHOD_JSON:
 
 EXPERIMENTS_JSON:
 {json.dumps(experiments, indent=2)}
+"""
 
+
+def build_user_prompt(data: dict) -> str:
+    title = report_title(data)
+
+    return f"""{build_input_block(data)}
 Generate an explanation report in Markdown.
 
 Return ONLY JSON in this format:
@@ -58,45 +169,29 @@ Markdown must follow this exact structure:
 
 # {title}
 
-## TL;DR (max 5 lines)
-...
-
-## 1. What problem does this paper solve?
-...
+{format_template(REPORT_SECTIONS)}
 
-## 2. Why is this problem hard?
-...
-
-## 3. What is the main contribution?
-...
-
-## 4. Core idea (intuitive explanation)
-...
-
-## 5. How the method works (step-by-step)
-1. ...
-2. ...
-
-## 6. Architecture / Components
-- **Component**: purpose
+Constraints:
+- If results are missing, say "Not clearly extracted".
+- If limitations are missing, say "Not explicitly stated".
+- Keep it clear and concise.
+"""
 
-## 7. Experiments and Results (What matters)
-...
 
-## 8. What do the results actually prove?
-...
+def build_group_prompt(data: dict, group: str) -> str:
+    sections = SECTION_GROUPS[group]
 
-## 9. Limitations / Assumptions
-...
+    return f"""{build_input_block(data)}
+Write only these sections of an explanation report, in Markdown.
 
-## 10. Practical takeaways (for engineers)
-...
+Return ONLY JSON in this format:
+{{
+  "markdown_sections": "string"
+}}
 
-## Glossary (simple definitions)
-- Term: meaning
+markdown_sections must contain exactly these "## " headings, in this order, and nothing before the first one:
 
-## Skeptical reviewer notes
-...
+{format_template(sections)}
 
 Constraints:
 - If results are missing, say "Not clearly extracted".
@@ -105,24 +200,121 @@ Constraints:
 """
 
 
-def generate_report(input_json_path: str, output_json_path: str, report_md_path: str, model: str):
-    if not os.path.exists(input_json_path):
-        raise FileNotFoundError(f"Input JSON not found: {input_json_path}")
-
-    with open(input_json_path, "r", encoding="utf-8") as f:
-        data = json.load(f)
-
-    client = init()
-    user_prompt = build_user_prompt(data)
+def generate_section_group(group: str, user_prompt: str, model: str | None = None,
+                           ctx: RunContext | None = None) -> dict:
+    """
+    Generate one group of sections, re-asking up to GROUP_RETRIES times for the
+    headings a response is missing or after every model in the route failed.
+    Only this group's prompt is re-sent. Returns {normalized heading: body}.
+    """
+    expected = [normalize_section_heading(h) for h, _ in SECTION_GROUPS[group]]
+    headings = dict(zip(expected, (h for h, _ in SECTION_GROUPS[group])))
+    bodies = {}
+    prompt = user_prompt
+    last_error = None
+
+    for attempt in range(GROUP_RETRIES + 1):
+        try:
+            response_json = call_stage_llm(
+                stage="generate_report",
+                system_prompt=SYSTEM_PROMPT,
+                user_prompt=prompt,
+                model=model,
+                ctx=ctx
+            )
+        except FALLBACK_ERRORS as e:
+            print(f"generate_report: group {group} failed ({type(e).__name__}: {e}) (attempt {attempt + 1}).")
+            last_error = e
+            continue
+
+        sections = split_report_sections(response_json.get("markdown_sections", ""))
+        found = match_template_sections(sections, [h for h in expected if h not in bodies])
+        bodies.update(found)
+
+        missing = [h for h in expected if h not in bodies]
+        if not missing:
+            return {h: bodies[h] for h in expected}
+
+        print(f"generate_report: group {group} missing {missing} (attempt {attempt + 1}).")
+        missing_headings = "\n".join(headings[h] for h in missing)
+        prompt = f"""{user_prompt}
+Your previous answer did not contain these headings. Write only these sections now,
+each starting with its "## " heading exactly as written:
+
+{missing_headings}
+"""
 
-    response_json = call_llm(
-        client=client,
+    if last_error is not None and not bodies:
+        raise last_error
+    missing = [h for h in expected if h not in bodies]
+    raise ValueError(f"missing sections {missing}")
+
+
+def generate_sectioned_report(data: dict, model: str | None = None, ctx: RunContext | None = None,
+                              group_prompts: dict | None = None) -> str:
+    """
+    Generate every section group in parallel and assemble them in template order.
+    A group that still fails after its retries fails the stage; the error names
+    the groups that failed and the ones that completed.
+    """
+    group_prompts = group_prompts or {group: build_group_prompt(data, group) for group in SECTION_GROUPS}
+
+    with ThreadPoolExecutor(max_workers=len(group_prompts)) as executor:
+        futures = {
+            group: executor.submit(generate_section_group, group, prompt, model, ctx)
+            for group, prompt in group_prompts.items()
+        }
+        section_bodies = {}
+        failed = {}
+        for group in SECTION_GROUPS:
+            try:
+                section_bodies.update(futures[group].result())
+            except FALLBACK_ERRORS as e:
+                failed[group] = e
+
+    if failed:
+        completed = [group for group in SECTION_GROUPS if group not in failed]
+        errors = "; ".join(f"{group}: {type(e).__name__}: {e}" for group, e in failed.items())
+        raise ValueError(f"Stage #05 failed: section groups failed ({errors}); completed groups: {', '.join(completed) or 'none'}.")
+
+    return assemble_report(report_title(data), section_bodies)
+
+
+def generate_single_report(user_prompt: str, model: str | None = None, ctx: RunContext | None = None) -> str:
+    response_json = call_stage_llm(
+        stage="generate_report",
         system_prompt=SYSTEM_PROMPT,
         user_prompt=user_prompt,
-        model=model
+        model=model,
+        ctx=ctx
     )
+    return response_json.get("markdown_report", "").strip()
+
+
+def generate_report(input_json_path: str, output_json_path: str, report_md_path: str, model: str | None = None, previous: dict | None = None,
+                    ctx: RunContext | None = None, sectioned: bool = False):
+    """
+    Stage #05. By default one call writes the whole report; with sectioned, the
+    section groups are written by parallel calls and assembled in template order.
+    """
+    if not os.path.exists(input_json_path):
+        raise FileNotFoundError(f"Input JSON not found: {input_json_path}")
+
+    data = load_document(input_json_path)
 
-    markdown_report = response_json.get("markdown_report", "").strip()
+    if sectioned:
+        group_prompts = {group: build_group_prompt(data, group) for group in SECTION_GROUPS}
+        user_prompt = "\0".join(group_prompts[group] for group in SECTION_GROUPS)
+    else:
+        user_prompt = build_user_prompt(data)
+    fingerprint = prompt_fingerprint("generate_report", SYSTEM_PROMPT, user_prompt, model)
+
+    if reuse_stage_output(data, previous, "generate_report", fingerprint, ["explanation_report"]):
+        markdown_report = data["explanation_report"].get("content", "").strip()
+    elif sectioned:
+        markdown_report = generate_sectioned_report(data, model=model, ctx=ctx, group_prompts=group_prompts)
+    else:
+        markdown_report = generate_single_report(user_prompt, model=model, ctx=ctx)
 
     if not markdown_report:
         raise ValueError("Stage #05 failed: markdown_report is empty.")
@@ -132,12 +324,14 @@ def generate_report(input_json_path: str, output_json_path: str, report_md_path:
     with open(report_md_path, "w", encoding="utf-8") as f:
         f.write(markdown_report)
 
-    # Append report into JSON
+    # Append report into JSON, keeping the content so Stage #06 can review it in memory
     data["explanation_report"] = {
         "format": "markdown",
-        "path": report_md_path
+        "path": report_md_path,
+        "content": markdown_report
     }
 
     # Save final JSON
-    with open(output_json_path, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
\ No newline at end of file
+    dump_document(data, output_json_path)
+
+    return data
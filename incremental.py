@@ -0,0 +1,67 @@
+import hashlib
+import json
+import os
+from model_routing import resolve_route
+from page_store import load_document
+from traces import expand_traces
+
+
+# Latest stage output first: later documents carry every earlier stage's results
+STAGE_OUTPUT_FILES = [
+    "output_s7.json",
+    "output_s6.json",
+    "output_s5.json",
+    "output_s4.json",
+    "output_s3.json",
+    "output_s2.json",
+    "output_s1.json"
+]
+
+
+def load_previous_document(output_dir: str) -> dict | None:
+    """
+    Load the most complete document of a previous run in output_dir, read
+    before this run overwrites it.
+    """
+    for file_name in STAGE_OUTPUT_FILES:
+        path = os.path.join(output_dir, file_name)
+        if os.path.exists(path):
+            return load_document(path)
+    return None
+
+
+def prompt_fingerprint(stage: str, system_prompt: str, user_prompt: str, model: str | None = None) -> str:
+    """
+    Everything an LLM stage's output depends on: its prompts and the models it routes to.
+    """
+    models = [e["model"] for e in resolve_route(stage, model)["models"]]
+
+    digest = hashlib.sha256()
+    for part in (stage, "|".join(models), system_prompt, user_prompt):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def reuse_stage_output(data: dict, previous: dict | None, stage: str, fingerprint: str, keys: list) -> bool:
+    """
+    Record the stage fingerprint on data. If the previous run produced the same
+    fingerprint, copy its outputs for keys into data and return True.
+    """
+    data.setdefault("stage_fingerprints", {})[stage] = fingerprint
+
+    if not previous:
+        return False
+    if previous.get("stage_fingerprints", {}).get(stage) != fingerprint:
+        return False
+    if not all(k in previous for k in keys):
+        return False
+
+    # Trace ids point into the previous document's trace table; inline them
+    # so this run builds its own table
+    table = previous.get("trace_table", {})
+    for k in keys:
+        data[k] = expand_traces(previous[k], table) if table else previous[k]
+
+    print(f"{stage}: inputs unchanged, reusing previous output.")
+    return True
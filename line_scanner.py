@@ -0,0 +1,94 @@
+import re
+from page_store import page_lines
+
+
+# Common research paper section names (regex-friendly)
+SECTION_PATTERNS = [
+    r"^abstract$",
+    r"^introduction$",
+    r"^related work$",
+    r"^background$",
+    r"^method$",
+    r"^methodology$",
+    r"^approach$",
+    r"^model$",
+    r"^architecture$",
+    r"^experiments$",
+    r"^experimental setup$",
+    r"^results$",
+    r"^discussion$",
+    r"^conclusion$",
+    r"^limitations$",
+    r"^future work$",
+    r"^references$",
+    r"^acknowledgements?$",
+    r"^appendix$"
+]
+
+SECTION_NAMES = [p.strip("^$") for p in SECTION_PATTERNS if p != r"^abstract$"]
+
+
+def first_letter_alternation(names: list) -> str:
+    """
+    Group alternatives by first letter (a(?:pproach|ppendix)|b(?:ackground)|...)
+    so a body line fails after one character test instead of one per name.
+    """
+    groups = {}
+    for name in sorted(names):
+        groups.setdefault(name[0], []).append(name[1:])
+    return "|".join(f"{first}(?:{'|'.join(rest)})" for first, rest in groups.items())
+
+
+# One anchored alternation classifies a stripped line in a single match.
+# Group order is priority order; lines matching none of them are body text.
+LINE_SCANNER_REGEX = re.compile(
+    r"^(?:"
+    r"(?P<caption>(?:figure|fig\.|table)\s+\d+[:\.]?\s+.*)"
+    r"|(?P<abstract>abstract\s*$)"
+    r"|(?P<section>(?:" + first_letter_alternation(SECTION_NAMES) + r")\s*$)"
+    r"|(?P<numbered_heading>\d+(?:\.\d+)*\.?\s+(?-i:[A-Z])[^.]{0,80}$)"
+    r"|(?P<noise>\d{1,4}$|arxiv:|©|copyright\b|preprint\b|under review\b)"
+    r")",
+    re.IGNORECASE
+)
+
+BODY = "body"
+LINE_CLASSES = ["caption", "abstract", "section", "numbered_heading", "noise"]
+
+# Classes that start a section in the outline (abstract is also a section heading)
+SECTION_CLASSES = {"abstract", "section"}
+
+
+def classify_line(line: str) -> str:
+    match = LINE_SCANNER_REGEX.match(line)
+    return match.lastgroup if match else BODY
+
+
+def scan_lines(lines: list) -> list:
+    """
+    Classify stripped lines once. Returns [line_index, class] for every
+    non-body line, which is what gets stored on the page record.
+    """
+    classes = []
+    match = LINE_SCANNER_REGEX.match
+    for i, line in enumerate(lines):
+        m = match(line)
+        if m:
+            classes.append([i, m.lastgroup])
+    return classes
+
+
+def page_line_classes(page: dict, wanted: set | None = None) -> tuple:
+    """
+    A page's stripped lines and their non-body classes, using the classes
+    stored at extraction time when present. With wanted, a page whose stored
+    classes contain none of them returns ([], []) without reading its text.
+    """
+    classes = page.get("line_classes")
+    if classes is not None and wanted is not None and not any(c in wanted for _, c in classes):
+        return [], []
+
+    lines = page_lines(page)
+    if classes is None:
+        classes = scan_lines(lines)
+    return lines, classes
@@ -1,64 +1,223 @@
+import argparse
+import signal
 import sys
 import os
 import json
 from claim_extraction import extract_claims
+from corpus_index import connect, ingest_documents
 from extractor import extract_pdf
 from generate_report import generate_report
+from incremental import load_previous_document
 from review_report import review_report
 from method_result_extraction import method_result_extraction
+from model_routing import latency_file, latency_tracker
+from numeric_checks import numeric_check_stage
 from outline import stage2_generate_outline
 from outline_refinement import refine_outline
+from page_store import dump_document, externalize_pages
+from profiling import PROFILE_MODES, settings_from_env
+from report_repair import DEFAULT_MAX_ITERATIONS, DEFAULT_SCORE_THRESHOLD, repair_report
+from run_context import COMPLETED, RunContext
+from trace_verification import verify_trace_stage
+from traces import trace_table_stage
 
-def main():
-    if len(sys.argv) < 2:
-        print("Usage: python extractor.py <path_to_pdf>")
-        sys.exit(1)
+# Files each stage writes; a stage that did not complete in this run must not
+# leave a previous run's file behind next to this run's outputs
+STAGE_OUTPUTS = {
+    "extract_pdf": ["output_s1.json"],
+    "outline": ["output_s2.json"],
+    "extract_claims": ["output_s3.json"],
+    "method_result_extraction": ["output_s4.json"],
+    "generate_report": ["output_s5.json", "explanation_report.md"],
+    "review_report": ["output_s6.json"],
+    "repair_report": ["output_s7.json"]
+}
+
+
+def remove_stale_outputs(ctx: RunContext, output_dir: str):
+    for stage, file_names in STAGE_OUTPUTS.items():
+        if ctx.completed(stage):
+            continue
+        for file_name in file_names:
+            path = os.path.join(output_dir, file_name)
+            if os.path.exists(path):
+                os.remove(path)
 
-    pdf_path = sys.argv[1]
 
-    output_dir = "output"
+def run_pipeline(pdf_path: str, output_dir: str, ctx: RunContext, incremental: bool = False, page_store: bool = False,
+                 sectioned_report: bool = False, repair: bool = False, repair_iterations: int = DEFAULT_MAX_ITERATIONS,
+                 repair_threshold: float = DEFAULT_SCORE_THRESHOLD, vision_figures: bool = False) -> dict:
+    """
+    Run every stage for one paper under ctx. A failing or cancelled stage does
+    not raise: its status is recorded, stages that depend on it are skipped and
+    everything produced so far is kept (e.g. the report when only the review
+    timed out). The per-stage status is written to run_status.json.
+    """
+    previous = load_previous_document(output_dir) if incremental else None
+    latency_path = latency_file(output_dir)
+    latency_tracker.load(latency_path)
     output_s1_json_path = os.path.join(output_dir, "output_s1.json")
     output_s2_json_path = os.path.join(output_dir, "output_s2.json")
     output_s3_json_path = os.path.join(output_dir, "output_s3.json")
     output_s4_json_path = os.path.join(output_dir, "output_s4.json")
     output_s5_json_path = os.path.join(output_dir, "output_s5.json")
     output_s6_json_path = os.path.join(output_dir, "output_s6.json")
+    output_s7_json_path = os.path.join(output_dir, "output_s7.json")
     output_report_md_path = os.path.join(output_dir, "explanation_report.md")
 
+    def stage1():
+        extracted_data = extract_pdf(pdf_path, output_dir=output_dir, previous=previous, render_key_figures=vision_figures)
+        if page_store:
+            externalize_pages(extracted_data, os.path.join(output_dir, "pages"))
 
-    print(f"Stage#01: PDF extraction started.")
-    extracted_data = extract_pdf(pdf_path, output_dir=output_dir)
+        os.makedirs(output_dir, exist_ok=True)
 
-    os.makedirs(output_dir, exist_ok=True)
+        dump_document(extracted_data, output_s1_json_path)
 
-    with open(output_s1_json_path, "w", encoding="utf-8") as f:
-        json.dump(extracted_data, f, indent=2, ensure_ascii=False)
-    print(f"Stage#01: PDF extraction completed.")
+        return extracted_data
+
+    print(f"Stage#01: PDF extraction started.")
+    extracted_data = ctx.run_stage("extract_pdf", stage1)
+    print(f"Stage#01: PDF extraction {ctx.stages['extract_pdf']['status']}.")
+
+    # A scan that could not be OCRed has nothing for the LLM stages to work on
+    if extracted_data and not extracted_data["extraction_notes"].get("has_text", True):
+        ctx.skip_remaining("no extractable text in PDF")
+        print(f"No extractable text in PDF; skipping the remaining stages.")
 
     print(f"Stage#02: Outline generation started.")
-    stage2_generate_outline(output_s1_json_path, output_s2_json_path)
-    print(f"Stage#02: Outline generation completed.")
+    ctx.run_stage("outline", stage2_generate_outline, output_s1_json_path, output_s2_json_path,
+                  requires=("extract_pdf",))
+    print(f"Stage#02: Outline generation {ctx.stages['outline']['status']}.")
 
     print(f"Stage#2.3: Outline refinement started.")
-    refine_outline(output_s2_json_path, output_s2_json_path, "openai/gpt-4.1-mini")
-    print(f"Stage#2.3: Outline refinement completed.")
+    ctx.run_stage("refine_outline", refine_outline, output_s2_json_path, output_s2_json_path,
+                  previous=previous, ctx=ctx, requires=("outline",))
+    print(f"Stage#2.3: Outline refinement {ctx.stages['refine_outline']['status']}.")
 
     print(f"Stage#03: Claim extraction started.")
-    extract_claims(output_s2_json_path, output_s3_json_path, "openai/gpt-4.1-mini")
-    print(f"Stage#03: Claim extraction completed.")
+    ctx.run_stage("extract_claims", extract_claims, output_s2_json_path, output_s3_json_path,
+                  previous=previous, ctx=ctx, requires=("refine_outline",))
+    print(f"Stage#03: Claim extraction {ctx.stages['extract_claims']['status']}.")
 
     print(f"Stage#04: Method and result extraction started.")
-    method_result_extraction(output_s3_json_path, output_s4_json_path, "openai/gpt-4.1-mini")
-    print(f"Stage#04: Method and result extraction completed.")
+    ctx.run_stage("method_result_extraction", method_result_extraction, output_s3_json_path, output_s4_json_path,
+                  previous=previous, ctx=ctx, vision=vision_figures, requires=("extract_claims",))
+    print(f"Stage#04: Method and result extraction {ctx.stages['method_result_extraction']['status']}.")
+
+    print(f"Stage#4.5: Trace verification started.")
+    ctx.run_stage("trace_verification", verify_trace_stage, output_s4_json_path, output_s4_json_path,
+                  requires=("method_result_extraction",))
+    print(f"Stage#4.5: Trace verification {ctx.stages['trace_verification']['status']}.")
+
+    print(f"Stage#4.6: Numeric consistency checks started.")
+    ctx.run_stage("numeric_checks", numeric_check_stage, output_s4_json_path, output_s4_json_path,
+                  requires=("method_result_extraction",))
+    print(f"Stage#4.6: Numeric consistency checks {ctx.stages['numeric_checks']['status']}.")
+
+    print(f"Stage#4.7: Trace table started.")
+    ctx.run_stage("trace_table", trace_table_stage, output_s4_json_path, output_s4_json_path,
+                  requires=("method_result_extraction",))
+    print(f"Stage#4.7: Trace table {ctx.stages['trace_table']['status']}.")
 
     print(f"Stage#05: Explanation report generation started.")
-    generate_report(output_s4_json_path, output_s5_json_path, output_report_md_path, "openai/gpt-4.1-mini")
-    print(f"Stage#05: Explanation report generation completed.")
+    report_data = ctx.run_stage("generate_report", generate_report, output_s4_json_path, output_s5_json_path, output_report_md_path,
+                                previous=previous, ctx=ctx, sectioned=sectioned_report, requires=("method_result_extraction",))
+    print(f"Stage#05: Explanation report generation {ctx.stages['generate_report']['status']}.")
 
     print(f"Stage#06: Explanation report review started.")
-    review_report(output_s5_json_path, output_s6_json_path, "openai/gpt-4.1-mini")
-    print(f"Stage#06: Explanation report review completed.")
+    reviewed_data = ctx.run_stage("review_report", review_report, output_s5_json_path, output_s6_json_path,
+                                  data=report_data, previous=previous, ctx=ctx, requires=("generate_report",))
+    print(f"Stage#06: Explanation report review {ctx.stages['review_report']['status']}.")
+
+    repaired_data = None
+    if repair:
+        print(f"Stage#07: Report repair started.")
+        repaired_data = ctx.run_stage("repair_report", repair_report, output_s6_json_path, output_s7_json_path, output_report_md_path,
+                                      data=reviewed_data, max_iterations=repair_iterations, score_threshold=repair_threshold,
+                                      ctx=ctx, requires=("review_report",))
+        print(f"Stage#07: Report repair {ctx.stages['repair_report']['status']}.")
+
+    corpus_db_path = os.getenv("ARXPLAIN_CORPUS_DB")
+    if corpus_db_path:
+        # Index the most complete document this run produced
+        document_path, document = next(
+            (path, doc) for path, doc in (
+                (output_s7_json_path, repaired_data),
+                (output_s6_json_path, reviewed_data),
+                (output_s5_json_path, report_data)
+            ) if doc or path == output_s5_json_path
+        )
+
+        def ingest():
+            conn = connect(corpus_db_path)
+            ingest_documents(conn, [(os.path.abspath(document_path), document)])
+            conn.close()
+
+        ctx.run_stage("corpus_ingest", ingest, requires=("generate_report",))
+        if ctx.completed("corpus_ingest"):
+            print(f"Ingested into corpus index: {corpus_db_path}")
+
+    remove_stale_outputs(ctx, output_dir)
+    latency_tracker.save(latency_path)
+
+    status = ctx.status()
+    os.makedirs(output_dir, exist_ok=True)
+    with open(os.path.join(output_dir, "run_status.json"), "w", encoding="utf-8") as f:
+        json.dump(status, f, indent=2, ensure_ascii=False)
+
+    return status
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate an explanation report for a research paper PDF.")
+    parser.add_argument("pdf_path")
+    parser.add_argument("--output-dir", default="output")
+    parser.add_argument("--incremental", action="store_true",
+                        help="reuse unchanged pages and stage outputs from the previous run in output-dir (e.g. for a new arXiv version)")
+    parser.add_argument("--page-store", action="store_true",
+                        help="keep page text once in a memory-mapped store under output-dir instead of in every stage JSON")
+    parser.add_argument("--sectioned-report", action="store_true",
+                        help="write the report's section groups with parallel LLM calls instead of one call")
+    parser.add_argument("--repair", action="store_true",
+                        help="rewrite the report sections the review flagged, re-reviewing until the score threshold")
+    parser.add_argument("--repair-iterations", type=int, default=DEFAULT_MAX_ITERATIONS)
+    parser.add_argument("--repair-threshold", type=float, default=DEFAULT_SCORE_THRESHOLD,
+                        help="overall review score (0-100) at which repair stops")
+    parser.add_argument("--vision-figures", action="store_true",
+                        help="render the most referenced figures downscaled and attach them to the method/result extraction prompt")
+    parser.add_argument("--deadline", type=float, default=None,
+                        help="seconds the whole run may take; stages still running at the deadline are cancelled and earlier outputs kept")
+    parser.add_argument("--profile", choices=PROFILE_MODES, default=None,
+                        help="profile stages with cProfile or the stack sampler; profiles go to output-dir/profiles")
+    parser.add_argument("--profile-stages", default=None,
+                        help="comma-separated stages to profile (default: all)")
+    parser.add_argument("--profile-memory", action="store_true",
+                        help="track each profiled stage's allocations with tracemalloc")
+    args = parser.parse_args()
+
+    profile = settings_from_env(os.path.join(args.output_dir, "profiles"), args.profile, args.profile_stages, args.profile_memory)
+    ctx = RunContext(deadline_seconds=args.deadline, profile=profile)
+
+    # Ctrl-C / SIGTERM stop in-flight LLM calls and skip the remaining stages;
+    # a second Ctrl-C aborts immediately
+    def on_signal(signum, frame):
+        if signum == signal.SIGINT and ctx.cancel_event.is_set():
+            raise KeyboardInterrupt
+        ctx.cancel("interrupted" if signum == signal.SIGINT else "terminated")
+
+    signal.signal(signal.SIGINT, on_signal)
+    signal.signal(signal.SIGTERM, on_signal)
+
+    status = run_pipeline(args.pdf_path, args.output_dir, ctx, incremental=args.incremental, page_store=args.page_store,
+                          sectioned_report=args.sectioned_report, repair=args.repair,
+                          repair_iterations=args.repair_iterations, repair_threshold=args.repair_threshold,
+                          vision_figures=args.vision_figures)
+
+    print(f"Run {status['status']}: {os.path.join(args.output_dir, 'run_status.json')}")
+    if status["status"] != COMPLETED:
+        sys.exit(1)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
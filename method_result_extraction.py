@@ -1,7 +1,20 @@
 import json
 import os
 import sys
-from ai_integration import init, call_llm
+from figures import format_key_figures, with_key_figure_images
+from incremental import prompt_fingerprint, reuse_stage_output
+from model_routing import call_stage_llm
+from page_store import dump_document, load_document
+from retrieval import (
+    format_chunks,
+    load_or_build_index,
+    pages_in_ranges,
+    retrieval_cache_dir,
+    retrieve,
+    select_chunks,
+    selected_pages
+)
+from run_context import RunContext
 
 
 SYSTEM_PROMPT = """
@@ -18,6 +31,10 @@ Rules:
 - Output must be valid JSON only.
 """
 
+METHOD_QUERY = "method approach model architecture layer encoder decoder attention training objective loss algorithm equation"
+EXPERIMENT_QUERY = "experiments results dataset benchmark metric baseline accuracy score table evaluation outperforms compared"
+LIMITATION_QUERY = "limitations conclusion discussion future work however drawback fails"
+
 def find_section_ranges(sections, keywords):
     ranges = []
     for sec in sections:
@@ -27,35 +44,55 @@ def find_section_ranges(sections, keywords):
     return ranges
 
 
-def collect_text_from_ranges(pages, ranges, max_chars=12000):
-    collected = []
-    for start, end in ranges:
-        for p in pages:
-            if start <= p["page_number"] <= end:
-                collected.append(f"[PAGE {p['page_number']}]\n{p['text']}")
-    combined = "\n\n".join(collected)
-    return combined[:max_chars]
+def format_tables_compact(tables, captions, page_numbers=None, max_chars=8000):
+    """
+    Render Stage #01 tables as pipe-separated rows, one block per table,
+    optionally restricted to the given pages.
+    """
+    caption_text = {c["caption_id"]: c["text"] for c in captions}
+    blocks = []
+
+    for table in tables:
+        if page_numbers is not None and table["page_number"] not in page_numbers:
+            continue
+
+        title = caption_text.get(table.get("caption_id"), "")
+        lines = [f"[TABLE {table['table_id']} | PAGE {table['page_number']}] {title}".strip()]
+        if table.get("header"):
+            lines.append(" | ".join(table["header"]))
+        lines.extend(" | ".join(row) for row in table["rows"])
+        blocks.append("\n".join(lines))
+
+    return "\n\n".join(blocks)[:max_chars]
 
 
-def build_user_prompt(data: dict) -> str:
+def build_user_prompt(data: dict, index=None) -> str:
     outline = data.get("outline", {})
     sections = outline.get("sections", [])
     pages = data.get("pages", [])
 
-    method_ranges = find_section_ranges(sections, ["method", "methodology", "approach", "model", "architecture", "self-attention", "training", "attention"])
-    exp_ranges = find_section_ranges(sections, ["experiment", "results", "evaluation", "benchmark"])
-    limit_ranges = find_section_ranges(sections, ["limitation", "discussion", "conclusion"])
+    if index is None:
+        index = load_or_build_index(pages)
 
-    method_text = collect_text_from_ranges(pages, method_ranges, max_chars=12000)
-    exp_text = collect_text_from_ranges(pages, exp_ranges, max_chars=12000)
-    limit_text = collect_text_from_ranges(pages, limit_ranges, max_chars=6000)
+    # Section matches boost retrieval; without them the method sits early and results late
+    method_pages = pages_in_ranges(find_section_ranges(sections, ["method", "methodology", "approach", "model", "architecture", "self-attention", "training", "attention"]))
+    exp_pages = pages_in_ranges(find_section_ranges(sections, ["experiment", "results", "evaluation", "benchmark"]))
+    limit_pages = pages_in_ranges(find_section_ranges(sections, ["limitation", "discussion", "conclusion"]))
 
-    # fallback if not found
-    if not method_text.strip():
-        method_text = "\n\n".join([f"[PAGE {p['page_number']}]\n{p['text']}" for p in pages[:4]])[:12000]
+    method_pages = method_pages or {p["page_number"] for p in pages[:4]}
+    exp_pages = exp_pages or {p["page_number"] for p in pages[-4:]}
 
-    if not exp_text.strip():
-        exp_text = "\n\n".join([f"[PAGE {p['page_number']}]\n{p['text']}" for p in pages[-4:]])[:12000]
+    method_text = retrieve(index, METHOD_QUERY, max_chars=12000, boost_pages=method_pages)
+    exp_chunks = select_chunks(index, EXPERIMENT_QUERY, max_chars=12000, boost_pages=exp_pages)
+    exp_text = format_chunks(index, exp_chunks)
+    limit_text = retrieve(index, LIMITATION_QUERY, max_chars=6000, boost_pages=limit_pages)
+
+    # Tables are sent separately in compact form; retrieval already uses table-free text
+    tables_text = format_tables_compact(
+        data.get("tables_raw", []),
+        data.get("captions", []),
+        page_numbers=exp_pages | selected_pages(index, exp_chunks)
+    )
 
     return f"""
 METHOD_SECTION_TEXT:
@@ -64,6 +101,9 @@ METHOD_SECTION_TEXT:
 EXPERIMENTS_RESULTS_TEXT:
 {exp_text}
 
+RESULTS_TABLES:
+{tables_text or "None extracted"}
+
 LIMITATIONS_CONCLUSION_TEXT:
 {limit_text}
 
@@ -143,27 +183,42 @@ Constraints:
 - Do not fabricate baselines, datasets, or numbers.
 - If you cannot find exact numeric values, use null.
 - Ensure every list item has trace.page and trace.snippet.
+- Prefer RESULTS_TABLES for numeric values; rows are pipe-separated cells.
+  For values taken from a table, trace.snippet may be the table row text.
 """
 
-def method_result_extraction(input_json: str, output_json: str, model: str):
+def method_result_extraction(input_json: str, output_json: str, model: str | None = None, previous: dict | None = None,
+                             ctx: RunContext | None = None, vision: bool = False):
+  """
+  With vision, the key figures rendered in Stage #01 are attached to the
+  prompt as images, for results only reported in plots.
+  """
   if not os.path.exists(input_json):
     raise FileNotFoundError(f"Input JSON not found: {input_json}")
 
-  with open(input_json, "r", encoding="utf-8") as f:
-    data = json.load(f)
+  data = load_document(input_json)
 
-  client = init()
-  user_prompt = build_user_prompt(data)
+  index = load_or_build_index(data.get("pages", []), retrieval_cache_dir(input_json))
+  user_prompt = build_user_prompt(data, index)
+  figures_text = format_key_figures(data) if vision else ""
+  if figures_text:
+    user_prompt += f"""
+ATTACHED_FIGURES (images in this order):
+{figures_text}
+- For values read from an attached figure, trace.snippet must be the figure's caption.
+"""
+  fingerprint = prompt_fingerprint("method_result_extraction", SYSTEM_PROMPT, user_prompt, model)
 
-  extracted = call_llm(
-    client=client,
-    system_prompt=SYSTEM_PROMPT,
-    user_prompt=user_prompt,
-    model=model
-  )
+  if not reuse_stage_output(data, previous, "method_result_extraction", fingerprint, ["method", "experiments"]):
+    extracted = call_stage_llm(
+      stage="method_result_extraction",
+      system_prompt=SYSTEM_PROMPT,
+      user_prompt=with_key_figure_images(user_prompt, data, os.path.dirname(input_json)) if figures_text else user_prompt,
+      model=model,
+      ctx=ctx
+    )
 
-  data["method"] = extracted.get("method", {})
-  data["experiments"] = extracted.get("experiments", {})
+    data["method"] = extracted.get("method", {})
+    data["experiments"] = extracted.get("experiments", {})
 
-  with open(output_json, "w", encoding="utf-8") as f:
-    json.dump(data, f, indent=2, ensure_ascii=False)
\ No newline at end of file
+  dump_document(data, output_json)
\ No newline at end of file
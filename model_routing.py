@@ -0,0 +1,306 @@
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import Future, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from openai import APIConnectionError, APITimeoutError, InternalServerError, RateLimitError
+from ai_integration import init, call_llm, LLMTimeoutError
+from run_context import RunContext
+
+
+FALLBACK_MODEL = os.getenv("GITHUB_AI_MODEL") or "openai/gpt-4.1-mini"
+
+# Structural stages get a small fast model, reasoning-heavy stages a larger one.
+# Every route falls back to GITHUB_AI_MODEL (or gpt-4.1-mini).
+# timeout: per-call deadline in seconds, covering all hedged attempts of one model.
+# hedge: send a duplicate request once the first is slower than the observed p95.
+# hedge_after: the delay in seconds to hedge after until enough latencies have
+# been observed for a p95 (one paper makes about one call per stage).
+DEFAULT_ROUTES = {
+    "refine_outline": {"models": ["openai/gpt-4.1-nano"], "timeout": 60, "hedge": True, "hedge_after": 10},
+    "extract_claims": {"models": ["openai/gpt-4.1"], "timeout": 180, "hedge": True, "hedge_after": 45},
+    "method_result_extraction": {"models": ["openai/gpt-4.1"], "timeout": 240, "hedge": True, "hedge_after": 60},
+    "generate_report": {"models": ["openai/gpt-4.1"], "timeout": 300, "hedge": True, "hedge_after": 90},
+    "review_report": {"models": ["openai/gpt-4.1-mini"], "timeout": 180, "hedge": True, "hedge_after": 30},
+    "repair_report": {"models": ["openai/gpt-4.1"], "timeout": 120, "hedge": True, "hedge_after": 45}
+}
+
+DEFAULT_TIMEOUT_SECONDS = 180
+
+# Errors that move a call on to the next attempt or model in the route
+FALLBACK_ERRORS = (APITimeoutError, RateLimitError, APIConnectionError, InternalServerError, ValueError, LLMTimeoutError)
+
+# Hedging only kicks in once enough latencies have been observed for a p95
+MIN_LATENCY_SAMPLES = 20
+LATENCY_WINDOW = 200
+
+
+class LatencyTracker:
+    """
+    Rolling window of successful call latencies per (stage, model).
+    """
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self.samples = defaultdict(lambda: deque(maxlen=window))
+        self.lock = threading.Lock()
+
+    def record(self, stage: str, model: str, seconds: float):
+        with self.lock:
+            self.samples[(stage, model)].append(seconds)
+
+    def percentile(self, stage: str, model: str, q: float) -> float | None:
+        with self.lock:
+            values = sorted(self.samples.get((stage, model), ()))
+        if len(values) < MIN_LATENCY_SAMPLES:
+            return None
+        return values[min(len(values) - 1, int(q * len(values)))]
+
+    def load(self, path: str):
+        """
+        Add the latencies saved by previous runs, so a run's first calls are
+        already hedged at an observed p95.
+        """
+        if not os.path.exists(path):
+            return
+        with open(path, "r", encoding="utf-8") as f:
+            saved = json.load(f)
+        with self.lock:
+            for entry in saved:
+                self.samples[(entry["stage"], entry["model"])].extend(entry["seconds"])
+
+    def save(self, path: str):
+        with self.lock:
+            saved = [
+                {"stage": stage, "model": model, "seconds": [round(s, 3) for s in values]}
+                for (stage, model), values in self.samples.items()
+            ]
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(saved, f, indent=2, ensure_ascii=False)
+        os.replace(path + ".tmp", path)
+
+
+latency_tracker = LatencyTracker()
+
+
+def latency_file(output_dir: str) -> str:
+    """
+    Where latency windows are kept between runs: ARXPLAIN_LATENCY_FILE (e.g.
+    one file shared by every paper's run) or output_dir/cache/latency.json.
+    """
+    return os.getenv("ARXPLAIN_LATENCY_FILE") or os.path.join(output_dir, "cache", "latency.json")
+
+
+def normalize_endpoint(entry) -> dict:
+    if isinstance(entry, str):
+        return {"model": entry}
+    return dict(entry)
+
+
+def load_route_overrides() -> dict:
+    """
+    Per-stage overrides, without code changes:
+    - ARXPLAIN_MODEL_ROUTES: path to a JSON file {stage: {"models": [...], "race": bool, "timeout": s, ...}}
+    - ARXPLAIN_MODEL_<STAGE>: comma-separated models, primary first
+    """
+    overrides = {}
+
+    routes_path = os.getenv("ARXPLAIN_MODEL_ROUTES")
+    if routes_path:
+        with open(routes_path, "r", encoding="utf-8") as f:
+            overrides.update(json.load(f))
+
+    for stage in DEFAULT_ROUTES:
+        models = os.getenv(f"ARXPLAIN_MODEL_{stage.upper()}")
+        if models:
+            route = dict(overrides.get(stage, {}))
+            route["models"] = [m.strip() for m in models.split(",") if m.strip()]
+            overrides[stage] = route
+
+    return overrides
+
+
+def resolve_route(stage: str, model: str | None = None) -> dict:
+    """
+    Build the route for a stage. An explicit model pins the stage to that model.
+    Each endpoint is {"model", optional "base_url", optional "api_key_env"}.
+    """
+    route = dict(DEFAULT_ROUTES.get(stage, {"models": [FALLBACK_MODEL]}))
+    route.update(load_route_overrides().get(stage, {}))
+    if model:
+        route["models"] = [model]
+
+    endpoints = [normalize_endpoint(m) for m in route.get("models", [])]
+    if not model and FALLBACK_MODEL not in [e["model"] for e in endpoints]:
+        endpoints.append({"model": FALLBACK_MODEL})
+
+    route["models"] = endpoints
+    route["race"] = bool(route.get("race", False))
+    route["hedge"] = bool(route.get("hedge", False))
+    route["timeout"] = route.get("timeout", DEFAULT_TIMEOUT_SECONDS)
+    return route
+
+
+class ClientPool:
+    """
+    Idle clients per endpoint. Each attempt holds its own client so a losing or
+    timed-out attempt can be cancelled by closing its connection; clients of
+    finished attempts go back to the pool.
+    """
+
+    def __init__(self):
+        self.idle = defaultdict(list)
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(endpoint: dict) -> tuple:
+        return (endpoint.get("base_url"), endpoint.get("api_key_env"))
+
+    def acquire(self, endpoint: dict):
+        with self.lock:
+            if self.idle[self.key(endpoint)]:
+                return self.idle[self.key(endpoint)].pop()
+
+        api_key = os.getenv(endpoint["api_key_env"]) if endpoint.get("api_key_env") else None
+        return init(base_url=endpoint.get("base_url"), api_key=api_key)
+
+    def release(self, endpoint: dict, client):
+        with self.lock:
+            self.idle[self.key(endpoint)].append(client)
+
+
+client_pool = ClientPool()
+
+
+def first_valid_response(stage: str, attempts: list, system_prompt: str, user_prompt: str | list, timeout: float | None,
+                         ctx: RunContext | None = None) -> dict:
+    """
+    Run attempts [(endpoint, start_after_seconds), ...] and return the first valid
+    JSON response. An attempt starts at its offset, or immediately once every
+    running attempt has failed. Remaining attempts are cancelled by closing their
+    clients. Raises LLMTimeoutError if nothing succeeds within timeout, and
+    RunCancelled as soon as ctx is cancelled or passes its deadline.
+    """
+    attempts = sorted(attempts, key=lambda a: a[1])
+    executor = ThreadPoolExecutor(max_workers=len(attempts))
+    clients = {}
+    running = {}
+    last_error = None
+
+    if ctx:
+        ctx.check()
+        timeout = ctx.bound_timeout(timeout)
+
+    start = time.monotonic()
+    deadline = start + timeout if timeout else None
+
+    # Completed by ctx.cancel() so the wait below wakes up without polling
+    cancelled = Future()
+    closed = set()
+
+    def close_running():
+        for future, (_, client) in list(clients.items()):
+            if not future.done():
+                closed.add(future)
+                client.close()
+        if not cancelled.done():
+            cancelled.set_result(None)
+
+    def run_attempt(client, endpoint: dict, remaining: float | None):
+        attempt_start = time.monotonic()
+        result = call_llm(
+            client=client,
+            system_prompt=system_prompt,
+            user_prompt=user_prompt,
+            model=endpoint["model"],
+            timeout=remaining
+        )
+        latency_tracker.record(stage, endpoint["model"], time.monotonic() - attempt_start)
+        return result
+
+    if ctx:
+        ctx.on_cancel(close_running)
+
+    try:
+        while attempts or running:
+            now = time.monotonic()
+            if deadline and now >= deadline:
+                raise LLMTimeoutError(f"{stage}: no response within {timeout}s")
+
+            while attempts and (attempts[0][1] <= now - start or not running):
+                endpoint, _ = attempts.pop(0)
+                client = client_pool.acquire(endpoint)
+                remaining = deadline - now if deadline else None
+                future = executor.submit(run_attempt, client, endpoint, remaining)
+                running[future] = endpoint
+                clients[future] = (endpoint, client)
+
+            wake_at = [t for t in (deadline, start + attempts[0][1] if attempts else None) if t]
+            wait_for = max(0.0, min(wake_at) - time.monotonic()) if wake_at else None
+
+            done, _ = wait([*running, cancelled], timeout=wait_for, return_when=FIRST_COMPLETED)
+            if ctx:
+                ctx.check()
+
+            for future in done - {cancelled}:
+                endpoint = running.pop(future)
+                try:
+                    return future.result()
+                except FALLBACK_ERRORS as e:
+                    last_error = e
+    finally:
+        if ctx:
+            ctx.remove_callback(close_running)
+        for future, (endpoint, client) in clients.items():
+            if future.done() and future not in closed:
+                client_pool.release(endpoint, client)
+            else:
+                client.close()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    raise last_error
+
+
+def hedge_delay(stage: str, route: dict, endpoint: dict) -> float | None:
+    if not route["hedge"]:
+        return None
+    p95 = latency_tracker.percentile(stage, endpoint["model"], 0.95)
+    return p95 if p95 is not None else route.get("hedge_after")
+
+
+def call_stage_llm(stage: str, system_prompt: str, user_prompt: str | list, model: str | None = None,
+                   ctx: RunContext | None = None) -> dict:
+    """
+    Call the LLM for a pipeline stage following its route: race the first two
+    endpoints if configured, otherwise try each endpoint in order on timeouts,
+    rate limits and invalid responses. Each endpoint call is bounded by the
+    route timeout and hedged with a duplicate request after the p95 latency
+    (or the route's hedge_after until a p95 has been observed).
+    With a run context, calls are also bounded by the run's deadline and
+    closed when the run is cancelled.
+    """
+    route = resolve_route(stage, model)
+    endpoints = route["models"]
+    last_error = None
+
+    if route["race"] and len(endpoints) > 1:
+        try:
+            return first_valid_response(stage, [(e, 0.0) for e in endpoints[:2]], system_prompt, user_prompt, route["timeout"], ctx)
+        except FALLBACK_ERRORS as e:
+            last_error = e
+            endpoints = endpoints[2:]
+
+    for endpoint in endpoints:
+        attempts = [(endpoint, 0.0)]
+        delay = hedge_delay(stage, route, endpoint)
+        if delay is not None:
+            attempts.append((endpoint, delay))
+
+        try:
+            return first_valid_response(stage, attempts, system_prompt, user_prompt, route["timeout"], ctx)
+        except FALLBACK_ERRORS as e:
+            print(f"{stage}: {endpoint['model']} failed ({type(e).__name__}), trying next model.")
+            last_error = e
+
+    raise last_error
@@ -0,0 +1,204 @@
+import json
+import os
+import re
+import sys
+import numpy as np
+from page_store import dump_document, load_document, page_text
+
+
+NUMBER_REGEX = re.compile(r"(?<![\w.])[-+−]?\d+(?:,\d{3})*(?:\.\d+)?")
+
+# Numbers are compared at 2 decimal places, packed together with their page key
+VALUE_SCALE = 100
+PAGE_KEY_SHIFT = 2 ** 40
+MAX_SCALED_VALUE = 2 ** 39 - 1
+
+DELTA_ABS_TOLERANCE = 0.011
+DELTA_REL_TOLERANCE = 0.01
+
+
+def parse_numbers(text: str) -> list:
+    numbers = []
+    for match in NUMBER_REGEX.findall(text or ""):
+        numbers.append(float(match.replace(",", "").replace("−", "-")))
+    return numbers
+
+
+def to_float(value) -> float:
+    if isinstance(value, bool) or value is None:
+        return np.nan
+    if isinstance(value, (int, float)):
+        return float(value)
+    parsed = parse_numbers(str(value))
+    return parsed[0] if parsed else np.nan
+
+
+def pack_keys(page_keys: np.ndarray, values: np.ndarray) -> np.ndarray:
+    scaled = np.rint(np.nan_to_num(values, nan=0.0) * VALUE_SCALE)
+    scaled = np.clip(scaled, -MAX_SCALED_VALUE, MAX_SCALED_VALUE).astype(np.int64)
+    return page_keys.astype(np.int64) * PAGE_KEY_SHIFT + scaled
+
+
+def collect_rows(documents: list) -> dict:
+    """
+    Flatten experiments.results of every document into column arrays, and
+    every page the rows cite into a packed (page_key, value) lookup array.
+    """
+    doc_index, row_index, pages, baseline, proposed, delta = [], [], [], [], [], []
+    page_keys = {}
+
+    for d, data in enumerate(documents):
+        results = data.get("experiments", {}).get("results", []) or []
+        for r, row in enumerate(results):
+            page = (row.get("trace") or {}).get("page")
+            doc_index.append(d)
+            row_index.append(r)
+            pages.append(page_keys.setdefault((d, page), len(page_keys)))
+            baseline.append(to_float(row.get("baseline_value")))
+            proposed.append(to_float(row.get("proposed_value")))
+            delta.append(to_float(row.get("delta")))
+
+    page_texts = {}
+    text_keys, text_values = [], []
+    for (d, page), key in page_keys.items():
+        if d not in page_texts:
+            page_texts[d] = {p.get("page_number"): page_text(p) for p in documents[d].get("pages", [])}
+        numbers = parse_numbers(page_texts[d].get(page, ""))
+        text_keys.extend([key] * len(numbers))
+        text_values.extend(numbers)
+
+    page_numbers = pack_keys(np.asarray(text_keys, dtype=np.int64), np.asarray(text_values, dtype=np.float64))
+
+    return {
+        "doc_index": np.asarray(doc_index, dtype=np.int64),
+        "row_index": np.asarray(row_index, dtype=np.int64),
+        "page_key": np.asarray(pages, dtype=np.int64),
+        "baseline": np.asarray(baseline, dtype=np.float64),
+        "proposed": np.asarray(proposed, dtype=np.float64),
+        "delta": np.asarray(delta, dtype=np.float64),
+        "page_numbers": np.unique(page_numbers)
+    }
+
+
+def found_in_text(page_numbers: np.ndarray, page_key: np.ndarray, values: np.ndarray) -> np.ndarray:
+    # Accept the value as printed, or as a percentage / fraction of it
+    found = np.zeros(values.shape, dtype=bool)
+    for factor in (1.0, VALUE_SCALE, 1.0 / VALUE_SCALE):
+        found |= np.isin(pack_keys(page_key, values * factor), page_numbers)
+    return found & ~np.isnan(values)
+
+
+def check_rows(rows: dict) -> dict:
+    baseline, proposed, delta = rows["baseline"], rows["proposed"], rows["delta"]
+
+    recomputed = proposed - baseline
+    with np.errstate(divide="ignore", invalid="ignore"):
+        relative = recomputed / np.abs(baseline) * 100.0
+
+    tolerance = DELTA_ABS_TOLERANCE + DELTA_REL_TOLERANCE * np.abs(recomputed)
+    has_delta = ~np.isnan(delta)
+    can_recompute = ~np.isnan(recomputed)
+
+    delta_matches = np.abs(delta - recomputed) <= tolerance
+    # Lower-is-better metrics are often reported as baseline - proposed
+    sign_flipped = ~delta_matches & (np.abs(delta + recomputed) <= tolerance)
+    relative_matches = np.abs(delta - relative) <= DELTA_ABS_TOLERANCE + DELTA_REL_TOLERANCE * np.abs(relative)
+
+    page_numbers, page_key = rows["page_numbers"], rows["page_key"]
+
+    return {
+        "recomputed_delta": recomputed,
+        "delta_mismatch": has_delta & can_recompute & ~delta_matches & ~sign_flipped & ~relative_matches,
+        "delta_sign_flipped": has_delta & can_recompute & sign_flipped,
+        "delta_relative": has_delta & can_recompute & ~delta_matches & ~sign_flipped & relative_matches,
+        "delta_missing": ~has_delta & can_recompute,
+        "baseline_not_in_text": ~np.isnan(baseline) & ~found_in_text(page_numbers, page_key, baseline),
+        "proposed_not_in_text": ~np.isnan(proposed) & ~found_in_text(page_numbers, page_key, proposed),
+        "delta_not_in_text": has_delta & ~found_in_text(page_numbers, page_key, delta)
+    }
+
+
+FLAG_NAMES = [
+    "delta_mismatch",
+    "delta_sign_flipped",
+    "delta_relative",
+    "delta_missing",
+    "baseline_not_in_text",
+    "proposed_not_in_text",
+    "delta_not_in_text"
+]
+
+# Flags that indicate a likely extraction error rather than a reporting convention
+MISMATCH_FLAGS = {"delta_mismatch", "baseline_not_in_text", "proposed_not_in_text"}
+
+
+def audit_documents(documents: list) -> list:
+    """
+    Check experiments.results across all documents in one vectorized pass.
+    Annotates each result row with numeric_check and returns one summary per
+    document, whose issues are the rows with a MISMATCH_FLAGS flag.
+    """
+    rows = collect_rows(documents)
+    checks = check_rows(rows)
+
+    summaries = [{"checked": 0, "mismatches": 0, "issues": []} for _ in documents]
+
+    for i in range(len(rows["doc_index"])):
+        d, r = int(rows["doc_index"][i]), int(rows["row_index"][i])
+        flags = [name for name in FLAG_NAMES if checks[name][i]]
+        recomputed = checks["recomputed_delta"][i]
+
+        row = documents[d]["experiments"]["results"][r]
+        row["numeric_check"] = {
+            "recomputed_delta": None if np.isnan(recomputed) else round(float(recomputed), 4),
+            "flags": flags
+        }
+
+        summary = summaries[d]
+        summary["checked"] += 1
+        # Only mismatches are issues; conventions (sign-flipped, relative or
+        # unprinted deltas) stay on the row's annotation
+        mismatches = [name for name in flags if name in MISMATCH_FLAGS]
+        if mismatches:
+            summary["mismatches"] += 1
+            summary["issues"].append({"path": f"experiments.results[{r}]", "flags": mismatches})
+
+    for data, summary in zip(documents, summaries):
+        data["numeric_checks"] = summary
+
+    return summaries
+
+
+def numeric_check_stage(input_json: str, output_json: str):
+    if not os.path.exists(input_json):
+        raise FileNotFoundError(f"Input JSON not found: {input_json}")
+
+    data = load_document(input_json)
+
+    audit_documents([data])
+
+    dump_document(data, output_json)
+
+    return data
+
+
+def audit_files(json_paths: list) -> dict:
+    documents = []
+    for path in json_paths:
+        documents.append(load_document(path))
+
+    summaries = audit_documents(documents)
+
+    for path, data in zip(json_paths, documents):
+        dump_document(data, path)
+
+    return dict(zip(json_paths, summaries))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python numeric_checks.py <output_s4.json> [<output_s4.json> ...]")
+        sys.exit(1)
+
+    for path, summary in audit_files(sys.argv[1:]).items():
+        print(f"{path}: {summary['checked']} rows checked, {summary['mismatches']} mismatches")
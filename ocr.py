@@ -0,0 +1,112 @@
+import fitz
+import hashlib
+import os
+import shutil
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+
+
+# Pages with fewer extracted characters than this are treated as scanned
+OCR_MIN_CHARS = int(os.getenv("ARXPLAIN_OCR_MIN_CHARS", "50"))
+
+OCR_DPI = 300
+OCR_LANG = os.getenv("ARXPLAIN_OCR_LANG", "eng")
+OCR_TIMEOUT_SECONDS = 120
+
+
+def tesseract_path() -> str | None:
+    return shutil.which(os.getenv("ARXPLAIN_TESSERACT", "tesseract"))
+
+
+def low_text_pages(pages: list, min_chars: int = OCR_MIN_CHARS) -> list:
+    """
+    Indices of pages whose text layer is (nearly) empty.
+    """
+    return [i for i, page in enumerate(pages) if page.get("char_count", 0) < min_chars]
+
+
+def run_tesseract(tesseract: str, png: bytes, lang: str) -> str:
+    result = subprocess.run(
+        [tesseract, "stdin", "stdout", "-l", lang],
+        input=png,
+        capture_output=True,
+        timeout=OCR_TIMEOUT_SECONDS,
+        check=True
+    )
+    return result.stdout.decode("utf-8", errors="replace")
+
+
+def tesseract_error(e: Exception) -> str:
+    if isinstance(e, subprocess.TimeoutExpired):
+        return f"timed out after {OCR_TIMEOUT_SECONDS}s"
+    if isinstance(e, subprocess.CalledProcessError):
+        stderr = (e.stderr or b"").decode("utf-8", errors="replace").strip()
+        detail = stderr.splitlines()[-1] if stderr else ""
+        return f"exit status {e.returncode}" + (f": {detail}" if detail else "")
+    return str(e)
+
+
+def ocr_worker(pdf_path: str, page_indices: list, cache_dir: str, tesseract: str, dpi: int, lang: str):
+    """
+    Render each page to a grayscale PNG and OCR it, reusing cached text for
+    pages whose rendering hashes the same. A page Tesseract fails on gets no
+    text and an error message instead of failing the whole chunk.
+    """
+    doc = fitz.open(pdf_path)
+    results = []
+
+    for page_index in page_indices:
+        page = doc.load_page(page_index)
+        png = page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY).tobytes("png")
+
+        page_hash = hashlib.sha256(png + f"|{dpi}|{lang}".encode("utf-8")).hexdigest()
+        cache_path = os.path.join(cache_dir, f"{page_hash}.txt")
+
+        if os.path.exists(cache_path):
+            with open(cache_path, "r", encoding="utf-8") as f:
+                text = f.read()
+        else:
+            try:
+                text = run_tesseract(tesseract, png, lang).strip()
+            except (subprocess.SubprocessError, OSError) as e:
+                results.append((page_index, None, tesseract_error(e)))
+                continue
+            with open(cache_path + ".tmp", "w", encoding="utf-8") as f:
+                f.write(text)
+            os.replace(cache_path + ".tmp", cache_path)
+
+        results.append((page_index, text, None))
+
+    doc.close()
+    return results
+
+
+def ocr_pages(pdf_path: str, page_indices: list, cache_dir: str, max_workers: int | None = None,
+              dpi: int = OCR_DPI, lang: str = OCR_LANG) -> tuple:
+    """
+    OCR the given pages with the local Tesseract binary, in parallel chunks of
+    pages. Returns ({page_index: text}, {page_index: error}) for the pages that
+    were and weren't OCR'd; both empty if Tesseract isn't installed.
+    """
+    tesseract = tesseract_path()
+    if not tesseract or not page_indices:
+        return {}, {}
+
+    os.makedirs(cache_dir, exist_ok=True)
+
+    max_workers = max_workers or os.cpu_count() or 1
+    max_workers = min(max_workers, len(page_indices))
+
+    if max_workers <= 1:
+        results = ocr_worker(pdf_path, page_indices, cache_dir, tesseract, dpi, lang)
+    else:
+        chunks = [page_indices[i::max_workers] for i in range(max_workers)]
+        results = []
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            n = len(chunks)
+            for chunk_results in executor.map(ocr_worker, [pdf_path] * n, chunks, [cache_dir] * n, [tesseract] * n, [dpi] * n, [lang] * n):
+                results.extend(chunk_results)
+
+    texts = {page_index: text for page_index, text, error in results if error is None}
+    errors = {page_index: error for page_index, text, error in results if error is not None}
+    return texts, errors
@@ -3,37 +3,8 @@ import os
 import re
 import sys
 from typing import List, Dict, Any
-
-
-# Common research paper section names (regex-friendly)
-SECTION_PATTERNS = [
-    r"^abstract$",
-    r"^introduction$",
-    r"^related work$",
-    r"^background$",
-    r"^method$",
-    r"^methodology$",
-    r"^approach$",
-    r"^model$",
-    r"^architecture$",
-    r"^experiments$",
-    r"^experimental setup$",
-    r"^results$",
-    r"^discussion$",
-    r"^conclusion$",
-    r"^limitations$",
-    r"^future work$",
-    r"^references$",
-    r"^acknowledgements?$",
-    r"^appendix$"
-]
-
-SECTION_REGEX = re.compile(
-    r"^(\d+(\.\d+)*)?\s*(" + "|".join(SECTION_PATTERNS) + r")\s*$",
-    re.IGNORECASE
-)
-
-ABSTRACT_HEADER_REGEX = re.compile(r"^abstract\s*$", re.IGNORECASE)
+from line_scanner import SECTION_CLASSES, page_line_classes
+from page_store import dump_document, load_document, page_lines
 
 
 def normalize_heading(text: str) -> str:
@@ -48,10 +19,11 @@ def extract_heading_candidates(pages: List[Dict[str, Any]]) -> List[Dict[str, An
 
     for page in pages:
         page_num = page["page_number"]
-        lines = [ln.strip() for ln in page["text"].split("\n") if ln.strip()]
+        lines, line_classes = page_line_classes(page, SECTION_CLASSES)
 
-        for ln in lines:
-            if SECTION_REGEX.match(ln):
+        for line_index, line_class in line_classes:
+            if line_class in SECTION_CLASSES:
+                ln = lines[line_index]
                 candidates.append({
                     "page": page_num,
                     "raw_heading": ln.strip(),
@@ -80,8 +52,7 @@ def guess_title(pages: List[Dict[str, Any]]) -> str | None:
     if not pages:
         return None
 
-    first_page_text = pages[0]["text"]
-    lines = [ln.strip() for ln in first_page_text.split("\n") if ln.strip()]
+    lines = page_lines(pages[0])
 
     # Only consider first ~15 lines
     lines = lines[:15]
@@ -112,35 +83,28 @@ def extract_abstract(pages: List[Dict[str, Any]]) -> str | None:
     - find "Abstract" heading
     - capture subsequent lines until next section heading
     """
-    full_lines = []
-
-    # Flatten all pages into (page_number, line) tuples
-    for page in pages:
-        page_num = page["page_number"]
-        lines = [ln.strip() for ln in page["text"].split("\n") if ln.strip()]
-        for ln in lines:
-            full_lines.append((page_num, ln))
-
-    abstract_start_index = None
-
-    for i, (_, line) in enumerate(full_lines):
-        if ABSTRACT_HEADER_REGEX.match(line):
-            abstract_start_index = i + 1
-            break
-
-    if abstract_start_index is None:
-        return None
-
     abstract_lines = []
+    in_abstract = False
 
-    for i in range(abstract_start_index, len(full_lines)):
-        _, line = full_lines[i]
+    for page in pages:
+        if not in_abstract:
+            lines, line_classes = page_line_classes(page, {"abstract"})
+            start = next((i for i, c in line_classes if c == "abstract"), None)
+            if start is None:
+                continue
+            in_abstract = True
+        else:
+            lines, line_classes = page_line_classes(page)
+            start = -1
 
         # stop if next section starts
-        if SECTION_REGEX.match(line) and not ABSTRACT_HEADER_REGEX.match(line):
+        end = next((i for i, c in line_classes if c == "section" and i > start), None)
+        abstract_lines.extend(lines[start + 1:end])
+        if end is not None:
             break
 
-        abstract_lines.append(line)
+    if not in_abstract:
+        return None
 
     abstract_text = " ".join(abstract_lines).strip()
     abstract_text = re.sub(r"\s+", " ", abstract_text)
@@ -188,8 +152,7 @@ def stage2_generate_outline(input_json_path: str, output_json_path: str):
     if not os.path.exists(input_json_path):
         raise FileNotFoundError(f"Input JSON not found: {input_json_path}")
 
-    with open(input_json_path, "r", encoding="utf-8") as f:
-        data = json.load(f)
+    data = load_document(input_json_path)
 
     pages = data.get("pages", [])
     page_count = data.get("source", {}).get("page_count", len(pages))
@@ -211,5 +174,4 @@ def stage2_generate_outline(input_json_path: str, output_json_path: str):
 
     data["outline"] = outline
 
-    with open(output_json_path, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
\ No newline at end of file
+    dump_document(data, output_json_path)
\ No newline at end of file
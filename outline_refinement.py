@@ -1,7 +1,10 @@
 import json
 import os
 import sys
-from ai_integration import init, call_llm
+from incremental import prompt_fingerprint, reuse_stage_output
+from model_routing import call_stage_llm
+from page_store import dump_document, load_document, page_text
+from run_context import RunContext
 
 SYSTEM_PROMPT = """
 You are an expert academic research paper parser.
@@ -25,7 +28,7 @@ def build_user_prompt(outline_raw_data: dict) -> str:
   pages = outline_raw_data.get("pages", [])
   outline = outline_raw_data.get("outline", {})
 
-  first_page_text = pages[0]["text"] if pages else ""
+  first_page_text = page_text(pages[0]) if pages else ""
   abstract = outline.get("abstract", "")
   candidates = outline.get("section_candidates", [])
 
@@ -82,25 +85,27 @@ def apply_outline_refinement(outline_raw_data: dict, refined_outline: dict) -> d
 
   return outline_raw_data
 
-def refine_outline(output_s2_json: str, output_path: str, model: str):
+def refine_outline(output_s2_json: str, output_path: str, model: str | None = None, previous: dict | None = None,
+                   ctx: RunContext | None = None):
   if not os.path.exists(output_s2_json):
     raise FileNotFoundError(f"Input JSON not found: {output_s2_json}")
 
-  with open(output_s2_json, "r", encoding="utf-8") as f:
-    stage2_data = json.load(f)
+  stage2_data = load_document(output_s2_json)
 
-    client = init()
+  user_prompt = build_user_prompt(stage2_data)
+  fingerprint = prompt_fingerprint("refine_outline", SYSTEM_PROMPT, user_prompt, model)
 
-    user_prompt = build_user_prompt(stage2_data)
-
-    refined_outline = call_llm(
-        client=client,
+  if reuse_stage_output(stage2_data, previous, "refine_outline", fingerprint, ["outline"]):
+    updated_data = stage2_data
+  else:
+    refined_outline = call_stage_llm(
+        stage="refine_outline",
         system_prompt=SYSTEM_PROMPT,
         user_prompt=user_prompt,
-        model=model
+        model=model,
+        ctx=ctx
     )
 
     updated_data = apply_outline_refinement(stage2_data, refined_outline)
 
-    with open(output_path, "w", encoding="utf-8") as f:
-        json.dump(updated_data, f, indent=2, ensure_ascii=False)
\ No newline at end of file
+  dump_document(updated_data, output_path)
\ No newline at end of file
@@ -0,0 +1,172 @@
+import json
+import mmap
+import os
+import numpy as np
+
+
+# Page record fields that can be moved into the store
+TEXT_KEYS = ["text", "text_without_tables"]
+
+BLOB_SUFFIX = ".bin"
+LINE_OFFSETS_SUFFIX = ".lines.npy"
+
+
+class PageStore:
+    """
+    Read-only view over a paper's page text: one contiguous UTF-8 blob plus an
+    int64 array of line start offsets, both memory-mapped so worker processes
+    opening the same paper share the OS page cache instead of private copies.
+    """
+
+    def __init__(self, blob_path: str):
+        self.blob_path = blob_path
+        with open(blob_path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            self.blob = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        self.line_offsets = np.load(blob_path[:-len(BLOB_SUFFIX)] + LINE_OFFSETS_SUFFIX, mmap_mode="r")
+
+    def text(self, start: int, end: int) -> str:
+        return str(memoryview(self.blob)[start:end], "utf-8")
+
+    def lines(self, line_start: int, line_end: int) -> list:
+        offsets = self.line_offsets[line_start:line_end + 1]
+        return [self.text(int(a), int(b)).rstrip("\n") for a, b in zip(offsets[:-1], offsets[1:])]
+
+
+_open_stores = {}
+
+
+def open_store(blob_path: str) -> PageStore:
+    store = _open_stores.get(blob_path)
+    if store is None:
+        store = _open_stores[blob_path] = PageStore(blob_path)
+    return store
+
+
+def page_text(page: dict, key: str = "text", default: str | None = "") -> str | None:
+    """
+    A page's text, whether it is inline (text) or in a page store (text_ref).
+    For text_without_tables, falls back to the full text when the page has no tables.
+    """
+    if key in page:
+        return page[key]
+
+    ref = page.get(f"{key}_ref")
+    if ref is not None:
+        return open_store(ref["store"]).text(ref["start"], ref["end"])
+
+    if key != "text":
+        return page_text(page, "text", default)
+    return default
+
+
+def page_lines(page: dict) -> list:
+    """
+    Stripped non-empty lines of a page, using the stored line offsets when available.
+    """
+    ref = page.get("text_ref")
+    if "text" in page or ref is None:
+        lines = page_text(page).split("\n")
+    else:
+        lines = open_store(ref["store"]).lines(ref["line_start"], ref["line_end"])
+    return [ln.strip() for ln in lines if ln.strip()]
+
+
+def externalize_pages(data: dict, store_prefix: str) -> dict:
+    """
+    Move page text fields of a document into a page store at store_prefix and
+    replace them with {"store", "start", "end"} references; in memory the store
+    path is absolute, dump_document writes it relative to the JSON file. The store is written
+    to a temporary file and swapped in, so readers of an older store keep a
+    valid mapping.
+    """
+    blob_path = os.path.abspath(store_prefix + BLOB_SUFFIX)
+    offsets_path = os.path.abspath(store_prefix + LINE_OFFSETS_SUFFIX)
+    os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+
+    line_offsets = []
+    position = 0
+
+    with open(blob_path + ".tmp", "wb") as blob:
+        for page in data.get("pages", []):
+            for key in TEXT_KEYS:
+                text = page_text(page, key, default=None) if (key in page or f"{key}_ref" in page) else None
+                if text is None:
+                    continue
+
+                ref = {"store": blob_path, "start": position}
+                if key == "text":
+                    ref["line_start"] = len(line_offsets)
+                    for line in text.split("\n"):
+                        line_offsets.append(position)
+                        encoded = (line + "\n").encode("utf-8")
+                        blob.write(encoded)
+                        position += len(encoded)
+                    ref["line_end"] = len(line_offsets)
+                    # The final newline is a separator, not part of the page text
+                    ref["end"] = position - 1
+                else:
+                    encoded = text.encode("utf-8")
+                    blob.write(encoded)
+                    position += len(encoded)
+                    ref["end"] = position
+
+                page.pop(key, None)
+                page[f"{key}_ref"] = ref
+
+    line_offsets.append(position)
+    with open(offsets_path + ".tmp", "wb") as f:
+        np.save(f, np.asarray(line_offsets, dtype=np.int64))
+
+    os.replace(offsets_path + ".tmp", offsets_path)
+    os.replace(blob_path + ".tmp", blob_path)
+    _open_stores.pop(blob_path, None)
+
+    data["page_store"] = {"blob": blob_path, "line_offsets": offsets_path}
+    return data
+
+
+def map_store_paths(data: dict, convert):
+    for page in data.get("pages", []):
+        for key in TEXT_KEYS:
+            ref = page.get(f"{key}_ref")
+            if ref is not None:
+                ref["store"] = convert(ref["store"])
+
+    store = data.get("page_store")
+    if store:
+        store["blob"] = convert(store["blob"])
+        store["line_offsets"] = convert(store["line_offsets"])
+
+
+def load_document(json_path: str) -> dict:
+    """
+    Load a stage JSON document, resolving its page store paths (relative to the
+    JSON file, so the output directory can be moved) to absolute paths.
+    """
+    with open(json_path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+
+    base_dir = os.path.dirname(os.path.abspath(json_path))
+    map_store_paths(data, lambda path: os.path.normpath(os.path.join(base_dir, path)))
+    return data
+
+
+def dump_document(data: dict, json_path: str):
+    """
+    Write a stage JSON document with its page store paths relative to the JSON file.
+    """
+    base_dir = os.path.dirname(os.path.abspath(json_path))
+    absolute = {}
+
+    def to_relative(path):
+        relative = os.path.relpath(path, base_dir) if os.path.isabs(path) else path
+        absolute[relative] = path
+        return relative
+
+    map_store_paths(data, to_relative)
+    try:
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
+    finally:
+        map_store_paths(data, lambda path: absolute.get(path, path))
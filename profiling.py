@@ -0,0 +1,204 @@
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+
+
+PROFILE_MODES = ["cprofile", "sample"]
+
+SAMPLE_INTERVAL_SECONDS = 0.005
+TOP_FUNCTIONS = 40
+TOP_ALLOCATIONS = 30
+
+
+class ProfileSettings:
+    """
+    Which stages to profile and how. Profiles are written to
+    <profile_dir>/<stage>.prof / .folded / .alloc.txt.
+    """
+
+    def __init__(self, profile_dir: str, mode: str | None = None, stages: set | None = None,
+                 memory: bool = False, interval: float = SAMPLE_INTERVAL_SECONDS):
+        if mode is not None and mode not in PROFILE_MODES:
+            raise ValueError(f"Unknown profile mode: {mode}")
+        self.profile_dir = profile_dir
+        self.mode = mode
+        self.stages = stages
+        self.memory = memory
+        self.interval = interval
+
+    def enabled(self, stage: str) -> bool:
+        if not self.mode and not self.memory:
+            return False
+        return self.stages is None or stage in self.stages
+
+
+def settings_from_env(profile_dir: str, mode: str | None = None, stages: str | None = None,
+                      memory: bool = False) -> ProfileSettings | None:
+    """
+    Settings from CLI values, falling back to ARXPLAIN_PROFILE (cprofile|sample),
+    ARXPLAIN_PROFILE_STAGES (comma list, default all) and ARXPLAIN_PROFILE_MEMORY=1
+    so production runs can be profiled without changing how they are started.
+    None when nothing is profiled.
+    """
+    mode = mode or os.getenv("ARXPLAIN_PROFILE") or None
+    stages = stages or os.getenv("ARXPLAIN_PROFILE_STAGES") or None
+    memory = memory or os.getenv("ARXPLAIN_PROFILE_MEMORY", "") in ("1", "true", "yes")
+    interval = float(os.getenv("ARXPLAIN_PROFILE_INTERVAL", SAMPLE_INTERVAL_SECONDS))
+
+    if not mode and not memory:
+        return None
+
+    stage_set = {s.strip() for s in stages.split(",") if s.strip()} if stages else None
+    return ProfileSettings(profile_dir, mode, stage_set, memory, interval)
+
+
+def frame_label(frame) -> str:
+    module = frame.f_globals.get("__name__") or os.path.basename(frame.f_code.co_filename)
+    return f"{module}:{frame.f_code.co_qualname}"
+
+
+class StackSampler:
+    """
+    Statistical profiler: a background thread that reads the Python stacks of
+    every other thread at a fixed interval and counts them as collapsed stacks
+    (root;...;leaf). Each sample is weighted by the microseconds since the
+    previous one, so a C call that holds the GIL past the interval (fitz text
+    extraction, image decoding) still gets its real share of the flamegraph.
+    """
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL_SECONDS):
+        self.interval = interval
+        self.counts = Counter()
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="stack-sampler", daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        self.thread.join()
+
+    def run(self):
+        own_id = threading.get_ident()
+        last = time.perf_counter()
+
+        while not self.stop_event.wait(self.interval):
+            now = time.perf_counter()
+            weight = max(1, int((now - last) * 1_000_000))
+            last = now
+
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(frame_label(frame))
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.counts[";".join(reversed(stack))] += weight
+
+    def write_folded(self, path: str):
+        """
+        Brendan Gregg's collapsed format, readable by flamegraph.pl, speedscope
+        and inferno. Values are microseconds of wall-clock time.
+        """
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in sorted(self.counts.items()):
+                f.write(f"{stack} {count}\n")
+
+
+def write_cprofile(profiler: cProfile.Profile, prof_path: str, text_path: str):
+    profiler.dump_stats(prof_path)
+
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+    with open(text_path, "w", encoding="utf-8") as f:
+        f.write(out.getvalue())
+
+
+ALLOCATION_FILTERS = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, __file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>")
+]
+
+
+def write_allocations(stage: str, before, after, peak: int, path: str):
+    """
+    Peak traced memory during the stage and the source lines whose allocations
+    grew the most between its start and end.
+    """
+    before = before.filter_traces(ALLOCATION_FILTERS)
+    after = after.filter_traces(ALLOCATION_FILTERS)
+    diffs = after.compare_to(before, "lineno")
+
+    lines = [
+        f"Stage: {stage}",
+        f"Peak traced memory: {peak / 1024 / 1024:.1f} MiB",
+        f"Retained at end: {sum(d.size_diff for d in diffs) / 1024 / 1024:.1f} MiB",
+        "",
+        f"Top {TOP_ALLOCATIONS} lines by retained allocation:"
+    ]
+    lines.extend(str(d) for d in diffs[:TOP_ALLOCATIONS])
+
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+@contextmanager
+def profile_stage(stage: str, settings: ProfileSettings | None):
+    """
+    Profile the enclosed block when settings select this stage. Only the calling
+    process is covered; work in process pools (table extraction, OCR) shows up as
+    time waiting on the pool.
+    """
+    if settings is None or not settings.enabled(stage):
+        yield
+        return
+
+    os.makedirs(settings.profile_dir, exist_ok=True)
+    base = os.path.join(settings.profile_dir, stage)
+
+    # Leave tracing alone if something else (e.g. an enclosing stage) started it
+    own_tracing = settings.memory and not tracemalloc.is_tracing()
+    if own_tracing:
+        tracemalloc.start()
+    if settings.memory:
+        tracemalloc.reset_peak()
+        before = tracemalloc.take_snapshot()
+
+    profiler = sampler = None
+    if settings.mode == "cprofile":
+        profiler = cProfile.Profile()
+        profiler.enable()
+    elif settings.mode == "sample":
+        sampler = StackSampler(settings.interval)
+        sampler.start()
+
+    try:
+        yield
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            write_cprofile(profiler, base + ".prof", base + ".txt")
+        if sampler is not None:
+            sampler.stop()
+            sampler.write_folded(base + ".folded")
+
+        if settings.memory:
+            after = tracemalloc.take_snapshot()
+            peak = tracemalloc.get_traced_memory()[1]
+            if own_tracing:
+                tracemalloc.stop()
+            write_allocations(stage, before, after, peak, base + ".alloc.txt")
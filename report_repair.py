@@ -0,0 +1,383 @@
+import json
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from generate_report import REPORT_SECTIONS, normalize_section_heading
+from model_routing import call_stage_llm
+from page_store import dump_document, load_document
+from review_report import SYSTEM_PROMPT as REVIEW_SYSTEM_PROMPT
+from review_report import build_review_payload, build_user_prompt as build_review_prompt, dumps_compact, load_report_content
+from run_context import RunContext
+
+
+SYSTEM_PROMPT = """
+You are a senior research mentor fixing one section of an explanation report.
+
+Rules:
+- Rewrite ONLY the given section, fixing every listed review finding.
+- Keep what the findings do not touch; do not shorten the section for its own sake.
+- Use only the evidence provided. Remove statements it does not support.
+- Do NOT invent numbers, datasets, or claims.
+- Output must be valid JSON only.
+"""
+
+DEFAULT_MAX_ITERATIONS = 2
+DEFAULT_SCORE_THRESHOLD = 80
+
+TEMPLATE_HEADINGS = [normalize_section_heading(h) for h, _ in REPORT_SECTIONS]
+
+# Structured data each template section is written from (by template position)
+SECTION_EVIDENCE = [
+    ["abstract", "claims"],
+    ["abstract", "claims"],
+    ["abstract", "claims"],
+    ["claims"],
+    ["abstract", "method"],
+    ["method"],
+    ["method"],
+    ["experiments", "numeric_checks"],
+    ["claims", "experiments", "numeric_checks"],
+    ["method", "experiments"],
+    ["method", "experiments"],
+    ["method"],
+    ["claims", "experiments", "trace_verification", "numeric_checks"]
+]
+
+# Names reviewers use for report sections (review section_scores keys and the like)
+SECTION_ALIASES = {
+    "tldr": 0,
+    "tl_dr": 0,
+    "summary": 0,
+    "problem": 1,
+    "problem_explanation": 1,
+    "contribution": 3,
+    "core_idea": 4,
+    "core_idea_explanation": 4,
+    "method": 5,
+    "method_explanation": 5,
+    "architecture": 6,
+    "components": 6,
+    "results": 7,
+    "results_explanation": 7,
+    "experiments": 7,
+    "limitations": 9,
+    "takeaways": 10,
+    "glossary": 11,
+    "reviewer_notes": 12,
+    "skeptical": 12
+}
+
+HEADING_LINE_REGEX = re.compile(r"^## .*$", re.MULTILINE)
+WORD_REGEX = re.compile(r"[a-z0-9]+")
+STOPWORDS = {"the", "a", "an", "and", "or", "of", "to", "in", "is", "it", "this", "that", "section", "for", "on", "with", "be"}
+
+# Share of a finding's words that must appear in a section for a fuzzy match
+MIN_OVERLAP = 0.6
+
+
+def tokens(text: str) -> set:
+    return {w for w in WORD_REGEX.findall(text.lower()) if w not in STOPWORDS}
+
+
+def parse_report(markdown: str) -> tuple:
+    """
+    Split a report into its preamble (title) and [[heading line, body], ...] in order.
+    """
+    matches = list(HEADING_LINE_REGEX.finditer(markdown))
+    preamble = markdown[:matches[0].start()].strip() if matches else markdown.strip()
+
+    sections = []
+    for i, match in enumerate(matches):
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(markdown)
+        sections.append([match.group(0).strip(), markdown[match.end():end].strip()])
+    return preamble, sections
+
+
+def join_report(preamble: str, sections: list) -> str:
+    parts = [preamble] if preamble else []
+    parts += [f"{heading}\n{body}" for heading, body in sections]
+    return "\n\n".join(parts)
+
+
+def match_section(name: str, headings: list) -> int | None:
+    """
+    Index in headings of the section a reviewer's section name (or instruction)
+    refers to: exact heading, section number, heading text, known alias, then
+    word overlap.
+    """
+    normalized = normalize_section_heading(name)
+    if normalized in headings:
+        return headings.index(normalized)
+
+    number = re.match(r"^(\d+)\b", normalized) or re.search(r"\bsection\s*(\d+)\b", normalized)
+    if number:
+        for i, heading in enumerate(headings):
+            if heading.startswith(f"{number.group(1)}."):
+                return i
+
+    for i, heading in enumerate(headings):
+        title = re.sub(r"^\d+\.\s*", "", heading).split(" (")[0]
+        if title and title in normalized:
+            return i
+
+    alias = SECTION_ALIASES.get(re.sub(r"[^a-z]+", "_", normalized).strip("_"))
+    if alias is None:
+        # A single alias word inside a longer instruction
+        aliases = {SECTION_ALIASES[w] for w in tokens(name) if w in SECTION_ALIASES}
+        alias = aliases.pop() if len(aliases) == 1 else None
+    if alias is not None and TEMPLATE_HEADINGS[alias] in headings:
+        return headings.index(TEMPLATE_HEADINGS[alias])
+
+    words = tokens(name)
+    if not words:
+        return None
+    scores = [len(words & tokens(heading)) / len(words) for heading in headings]
+    best = max(range(len(headings)), key=lambda i: scores[i], default=None)
+    if best is not None and scores[best] >= MIN_OVERLAP:
+        return best
+    return None
+
+
+def locate_statement(statement: str, sections: list) -> int | None:
+    """
+    Index of the section whose body contains a (hallucinated) statement.
+    """
+    needle = " ".join(statement.lower().split())
+    for i, (_, body) in enumerate(sections):
+        if needle and needle in " ".join(body.lower().split()):
+            return i
+
+    words = tokens(statement)
+    if not words:
+        return None
+    scores = [len(words & tokens(body)) / len(words) for _, body in sections]
+    best = max(range(len(sections)), key=lambda i: scores[i], default=None)
+    if best is not None and scores[best] >= MIN_OVERLAP:
+        return best
+    return None
+
+
+def collect_findings(review: dict, sections: list) -> tuple:
+    """
+    Map review output onto report sections. Returns ({heading line: [finding, ...]},
+    [findings that could not be tied to a section]).
+    """
+    headings = [normalize_section_heading(h) for h, _ in sections]
+    findings = {}
+    unassigned = []
+
+    def add(index, text):
+        if index is None:
+            unassigned.append(text)
+        else:
+            findings.setdefault(sections[index][0], []).append(text)
+
+    for name in review.get("missing_sections", []) or []:
+        index = match_section(name, TEMPLATE_HEADINGS)
+        if index is None:
+            unassigned.append(f"Missing section: {name}")
+        elif TEMPLATE_HEADINGS[index] not in headings:
+            findings.setdefault(REPORT_SECTIONS[index][0], []).append("This section is missing from the report; write it.")
+        else:
+            add(headings.index(TEMPLATE_HEADINGS[index]), "The reviewer found this section missing or empty; write it properly.")
+
+    for item in review.get("weak_explanations", []) or []:
+        add(match_section(item.get("section", ""), headings),
+            f"Weak explanation: {item.get('problem', '')} Fix: {item.get('fix_suggestion', '')}".strip())
+
+    for item in review.get("hallucinated_statements", []) or []:
+        add(locate_statement(item.get("statement", ""), sections),
+            f"Unsupported statement ({item.get('severity', 'medium')}): \"{item.get('statement', '')}\" Reason: {item.get('reason', '')}")
+
+    for instruction in review.get("rewrite_instructions", []) or []:
+        index = match_section(instruction, headings)
+        if index is None:
+            index = locate_statement(instruction, sections)
+        add(index, f"Instruction: {instruction}")
+
+    return findings, unassigned
+
+
+def section_evidence(data: dict, heading: str) -> dict:
+    payload = build_review_payload(data)
+    payload["abstract"] = payload["outline"].get("abstract", "")
+
+    normalized = normalize_section_heading(heading)
+    if normalized in TEMPLATE_HEADINGS:
+        keys = SECTION_EVIDENCE[TEMPLATE_HEADINGS.index(normalized)]
+    else:
+        keys = ["abstract", "claims", "method", "experiments"]
+    return {k: payload[k] for k in keys}
+
+
+def build_patch_prompt(heading: str, body: str, section_findings: list, evidence: dict) -> str:
+    findings_text = "\n".join(f"- {f}" for f in section_findings)
+
+    return f"""
+SECTION_HEADING:
+{heading}
+
+CURRENT_SECTION_MARKDOWN:
+{body or "(missing)"}
+
+REVIEW_FINDINGS:
+{findings_text}
+
+EVIDENCE_JSON:
+{dumps_compact(evidence)}
+
+Rewrite this section so it fixes the review findings.
+
+Return ONLY JSON in this format:
+{{
+  "section_markdown": "string"
+}}
+
+Constraints:
+- section_markdown is the section body only, without the "{heading}" heading line.
+- If the evidence does not cover something, say "Not clearly extracted".
+"""
+
+
+def patch_section(heading: str, body: str, section_findings: list, evidence: dict, model: str | None = None,
+                  ctx: RunContext | None = None) -> tuple:
+    user_prompt = build_patch_prompt(heading, body, section_findings, evidence)
+    response_json = call_stage_llm(
+        stage="repair_report",
+        system_prompt=SYSTEM_PROMPT,
+        user_prompt=user_prompt,
+        model=model,
+        ctx=ctx
+    )
+
+    patched = response_json.get("section_markdown", "").strip()
+    # Drop the heading if the model repeated it
+    if patched.startswith("## "):
+        patched = patched.split("\n", 1)[1].strip() if "\n" in patched else ""
+    if not patched:
+        raise ValueError(f"Report repair failed: empty section for {heading}.")
+
+    return patched, len(user_prompt)
+
+
+def insert_section(sections: list, heading: str, body: str):
+    """
+    Insert a missing template section before the next template section present.
+    """
+    position = TEMPLATE_HEADINGS.index(normalize_section_heading(heading))
+    later = set(TEMPLATE_HEADINGS[position + 1:])
+    for i, (h, _) in enumerate(sections):
+        if normalize_section_heading(h) in later:
+            sections.insert(i, [heading, body])
+            return
+    sections.append([heading, body])
+
+
+def repair_report_content(data: dict, model: str | None = None, max_iterations: int = DEFAULT_MAX_ITERATIONS,
+                          score_threshold: float = DEFAULT_SCORE_THRESHOLD, ctx: RunContext | None = None) -> dict:
+    """
+    Patch the sections the review flagged, re-review, and repeat until the
+    overall score reaches score_threshold or max_iterations is spent. An
+    iteration that lowers the score is discarded. Updates data in place
+    and returns the repair record.
+    """
+    review = data.get("review", {})
+    iterations = []
+    stop_reason = "max_iterations"
+
+    for _ in range(max_iterations):
+        score = review.get("overall_score", 0)
+        if score >= score_threshold:
+            stop_reason = "score_threshold"
+            break
+
+        preamble, sections = parse_report(load_report_content(data))
+        findings, unassigned = collect_findings(review, sections)
+        if not findings:
+            stop_reason = "no_section_findings"
+            break
+
+        bodies = dict((h, b) for h, b in sections)
+        with ThreadPoolExecutor(max_workers=len(findings)) as executor:
+            futures = {
+                heading: executor.submit(patch_section, heading, bodies.get(heading, ""), section_findings,
+                                         section_evidence(data, heading), model, ctx)
+                for heading, section_findings in findings.items()
+            }
+            patches = {heading: future.result() for heading, future in futures.items()}
+
+        for heading, (patched, _) in patches.items():
+            if heading in bodies:
+                for section in sections:
+                    if section[0] == heading:
+                        section[1] = patched
+            else:
+                insert_section(sections, heading, patched)
+
+        # Review a patched copy; data only takes the patch once it is reviewed and
+        # not worse, so a failed or cancelled re-review leaves data consistent
+        patched_report = {**data["explanation_report"], "content": join_report(preamble, sections)}
+
+        review_prompt = build_review_prompt({**data, "explanation_report": patched_report})
+        new_review = call_stage_llm(
+            stage="review_report",
+            system_prompt=REVIEW_SYSTEM_PROMPT,
+            user_prompt=review_prompt,
+            model=model,
+            ctx=ctx
+        )
+
+        new_score = new_review.get("overall_score", 0)
+        iterations.append({
+            "score_before": score,
+            "score_after": new_score,
+            "sections": list(patches),
+            "unassigned_findings": unassigned,
+            "prompt_chars": sum(chars for _, chars in patches.values()) + len(review_prompt)
+        })
+
+        if new_score < score:
+            stop_reason = "score_regressed"
+            break
+
+        data["explanation_report"] = patched_report
+        review = new_review
+        data["review"] = review
+
+    return {
+        "iterations": iterations,
+        "final_score": review.get("overall_score", 0),
+        "score_threshold": score_threshold,
+        "stop_reason": stop_reason
+    }
+
+
+def repair_report(input_json_path: str, output_json_path: str, report_md_path: str, model: str | None = None,
+                  data: dict | None = None, max_iterations: int = DEFAULT_MAX_ITERATIONS,
+                  score_threshold: float = DEFAULT_SCORE_THRESHOLD, ctx: RunContext | None = None):
+    if data is None:
+        if not os.path.exists(input_json_path):
+            raise FileNotFoundError(f"Input JSON not found: {input_json_path}")
+
+        data = load_document(input_json_path)
+
+    if "review" not in data:
+        raise ValueError("Report repair needs a reviewed report (Stage #06 output).")
+
+    # Repair replaces top-level keys only; a shallow copy keeps the caller's
+    # Stage #06 document intact if a later iteration fails
+    data = dict(data)
+
+    data["repair"] = repair_report_content(data, model=model, max_iterations=max_iterations,
+                                           score_threshold=score_threshold, ctx=ctx)
+
+    if data["repair"]["iterations"]:
+        os.makedirs(os.path.dirname(report_md_path) or ".", exist_ok=True)
+        with open(report_md_path, "w", encoding="utf-8") as f:
+            f.write(data["explanation_report"]["content"])
+        data["explanation_report"]["path"] = report_md_path
+
+    dump_document(data, output_json_path)
+
+    return data
+
@@ -0,0 +1,200 @@
+import hashlib
+import os
+import re
+import numpy as np
+from page_store import page_text
+
+
+CHUNK_WORDS = 180
+CHUNK_OVERLAP_WORDS = 30
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Score multiplier for chunks on pages of sections whose names match the stage
+SECTION_BOOST = 1.5
+
+TOKEN_REGEX = re.compile(r"[a-z0-9]+(?:[-'][a-z0-9]+)*")
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "has", "have", "in", "is",
+    "it", "its", "of", "on", "or", "that", "the", "this", "to", "was", "we", "were", "which", "with"
+}
+
+
+def tokenize(text: str) -> list:
+    return [t for t in TOKEN_REGEX.findall(text.lower()) if t not in STOPWORDS and len(t) > 1]
+
+
+def chunk_pages(pages: list, chunk_words: int = CHUNK_WORDS, overlap: int = CHUNK_OVERLAP_WORDS) -> list:
+    """
+    Split each page into overlapping word windows. Chunks never cross pages,
+    so every chunk keeps an exact page number for traces.
+    """
+    chunks = []
+    step = max(1, chunk_words - overlap)
+
+    for page in pages:
+        words = page_text(page, "text_without_tables").split()
+        for start in range(0, max(len(words), 1), step):
+            window = words[start:start + chunk_words]
+            if window:
+                chunks.append({"page": page["page_number"], "text": " ".join(window)})
+            if start + chunk_words >= len(words):
+                break
+
+    return chunks
+
+
+class BM25Index:
+    """
+    BM25 weights for every (chunk, term) held in a dense float32 matrix, so a
+    query is a column gather and a row sum.
+    """
+
+    def __init__(self, chunk_pages: np.ndarray, chunk_texts: np.ndarray, vocab: np.ndarray, weights: np.ndarray):
+        self.chunk_pages = chunk_pages
+        self.chunk_texts = chunk_texts
+        self.vocab = vocab
+        self.term_ids = {term: i for i, term in enumerate(vocab.tolist())}
+        self.weights = weights
+
+    @classmethod
+    def build(cls, chunks: list) -> "BM25Index":
+        tokenized = [tokenize(c["text"]) for c in chunks]
+        vocab = sorted({t for tokens in tokenized for t in tokens})
+        term_ids = {term: i for i, term in enumerate(vocab)}
+
+        tf = np.zeros((len(chunks), len(vocab)), dtype=np.float32)
+        for row, tokens in enumerate(tokenized):
+            for t in tokens:
+                tf[row, term_ids[t]] += 1
+
+        doc_len = tf.sum(axis=1, keepdims=True)
+        avg_len = float(doc_len.mean()) if len(chunks) else 0.0
+        df = (tf > 0).sum(axis=0)
+        idf = np.log(1 + (len(chunks) - df + 0.5) / (df + 0.5)).astype(np.float32)
+
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * doc_len / max(avg_len, 1e-9))
+        weights = idf * tf * (BM25_K1 + 1) / (tf + norm)
+
+        return cls(
+            np.asarray([c["page"] for c in chunks], dtype=np.int32),
+            np.asarray([c["text"] for c in chunks], dtype=str),
+            np.asarray(vocab, dtype=str),
+            weights.astype(np.float32)
+        )
+
+    def save(self, path: str):
+        np.savez_compressed(path, chunk_pages=self.chunk_pages, chunk_texts=self.chunk_texts,
+                            vocab=self.vocab, weights=self.weights)
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        with np.load(path) as f:
+            return cls(f["chunk_pages"], f["chunk_texts"], f["vocab"], f["weights"])
+
+    def score(self, query: str) -> np.ndarray:
+        ids = [self.term_ids[t] for t in set(tokenize(query)) if t in self.term_ids]
+        if not ids:
+            return np.zeros(len(self.chunk_pages), dtype=np.float32)
+        return self.weights[:, ids].sum(axis=1)
+
+
+def paper_hash(pages: list) -> str:
+    digest = hashlib.sha256()
+    for page in pages:
+        digest.update(page_text(page, "text_without_tables").encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def load_or_build_index(pages: list, cache_dir: str | None = None) -> BM25Index:
+    """
+    Build the BM25 index for a paper, reusing a cached copy keyed by the paper's text hash.
+    """
+    cache_path = None
+    if cache_dir:
+        cache_path = os.path.join(cache_dir, f"{paper_hash(pages)}.npz")
+        if os.path.exists(cache_path):
+            return BM25Index.load(cache_path)
+
+    index = BM25Index.build(chunk_pages(pages))
+
+    if cache_path:
+        os.makedirs(cache_dir, exist_ok=True)
+        index.save(cache_path)
+
+    return index
+
+
+def select_chunks(index: BM25Index, query: str, max_chars: int, boost_pages: set | None = None) -> list:
+    """
+    Pick the highest-scoring chunks for a query until max_chars is spent.
+    Returns chunk indices in document order.
+    """
+    scores = index.score(query)
+    if boost_pages:
+        scores = scores * np.where(np.isin(index.chunk_pages, list(boost_pages)), SECTION_BOOST, 1.0)
+
+    selected = []
+    used = 0
+    for i in np.argsort(-scores, kind="stable"):
+        if scores[i] <= 0:
+            break
+        cost = len(index.chunk_texts[i]) + 12
+        if used + cost > max_chars:
+            continue
+        selected.append(int(i))
+        used += cost
+
+    # Spend what is left of the budget on the boosted pages in reading order,
+    # so matched sections still come through when the query terms don't
+    if boost_pages:
+        chosen = set(selected)
+        for i in np.flatnonzero(np.isin(index.chunk_pages, list(boost_pages))):
+            cost = len(index.chunk_texts[i]) + 12
+            if int(i) in chosen or used + cost > max_chars:
+                continue
+            selected.append(int(i))
+            used += cost
+
+    return sorted(selected)
+
+
+def selected_pages(index: BM25Index, selected: list) -> set:
+    return {int(index.chunk_pages[i]) for i in selected}
+
+
+def format_chunks(index: BM25Index, selected: list) -> str:
+    """
+    Emit selected chunks grouped under [PAGE n] headers.
+    """
+    parts = []
+    last_page = None
+    last_chunk = None
+    for i in selected:
+        page = int(index.chunk_pages[i])
+        text = str(index.chunk_texts[i])
+        if page != last_page:
+            parts.append(f"[PAGE {page}]")
+            last_page = page
+        elif last_chunk == i - 1:
+            # Consecutive windows on the same page share CHUNK_OVERLAP_WORDS words
+            text = " ".join(text.split()[CHUNK_OVERLAP_WORDS:])
+        parts.append(text)
+        last_chunk = i
+
+    return "\n".join(parts)
+
+
+def retrieve(index: BM25Index, query: str, max_chars: int, boost_pages: set | None = None) -> str:
+    return format_chunks(index, select_chunks(index, query, max_chars, boost_pages))
+
+
+def pages_in_ranges(ranges) -> set:
+    return {n for start, end in ranges for n in range(start, end + 1)}
+
+
+def retrieval_cache_dir(input_json: str) -> str:
+    return os.path.join(os.path.dirname(input_json) or ".", "cache", "retrieval")
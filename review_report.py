@@ -1,7 +1,11 @@
 import json
 import os
 import sys
-from ai_integration import init, call_llm
+from incremental import prompt_fingerprint, reuse_stage_output
+from model_routing import call_stage_llm
+from page_store import dump_document, load_document
+from run_context import RunContext
+from traces import compact_traces
 
 
 SYSTEM_PROMPT = """
@@ -19,31 +23,100 @@ Rules:
 - Identify missing content, unclear explanations, and hallucinations.
 - Hallucination means: any claim not supported by the extracted structured data.
 - Be strict and skeptical.
+- TRACE_VERIFICATION lists extracted items whose quoted snippet could not be found
+  in the paper text (unverified) or was found on a different page (wrong_page).
+  Treat report statements built on those items as likely hallucinations.
+- NUMERIC_CHECKS lists experiment result rows whose numbers do not match: flags are
+  baseline_not_in_text / proposed_not_in_text (value not found on the cited page)
+  and delta_mismatch (delta is not proposed_value - baseline_value).
 - Output must be valid JSON only.
 """
 
 
-def build_user_prompt(data: dict) -> str:
+# Outline fields that only exist for debugging earlier stages
+OUTLINE_DEBUG_FIELDS = {"section_candidates"}
+
+# Per-item annotations that are summarized separately in the payload
+ITEM_ANNOTATION_FIELDS = {"numeric_check"}
+
+
+def build_review_payload(data: dict) -> dict:
     outline = data.get("outline", {})
-    claims = data.get("claims", {})
-    method = data.get("method", {})
-    experiments = data.get("experiments", {})
-    report_md = data.get("explanation_report", {}).get("content", "")
+
+    sections = [
+        {"name": s.get("name"), "start_page": s.get("start_page"), "end_page": s.get("end_page")}
+        for s in outline.get("sections", [])
+    ]
+
+    compact_outline = {
+        k: v for k, v in outline.items()
+        if k not in OUTLINE_DEBUG_FIELDS and k != "sections"
+    }
+    compact_outline["sections"] = sections
+
+    verification = data.get("trace_verification", {})
+    # Item traces go in as page numbers only; snippets are inlined just for
+    # the traces that failed verification
+    trace_issues = [
+        {k: issue.get(k) for k in ("path", "status", "cited_page", "matched_page", "snippet")}
+        for issue in verification.get("issues", [])
+    ]
+
+    return {
+        "outline": compact_outline,
+        "claims": compact_traces(data.get("claims", {}), ITEM_ANNOTATION_FIELDS),
+        "method": compact_traces(data.get("method", {}), ITEM_ANNOTATION_FIELDS),
+        "experiments": compact_traces(data.get("experiments", {}), ITEM_ANNOTATION_FIELDS),
+        "trace_verification": {
+            "checked": verification.get("checked", 0),
+            "issues": trace_issues
+        },
+        "numeric_checks": data.get("numeric_checks", {"checked": 0, "issues": []})
+    }
+
+
+def dumps_compact(value) -> str:
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+
+
+def load_report_content(data: dict) -> str:
+    report = data.get("explanation_report", {})
+    content = report.get("content")
+    if content:
+        return content
+
+    # Older Stage #05 outputs only recorded the markdown path
+    report_path = report.get("path")
+    if report_path and os.path.exists(report_path):
+        with open(report_path, "r", encoding="utf-8") as f:
+            return f.read()
+    return ""
+
+
+def build_user_prompt(data: dict) -> str:
+    payload = build_review_payload(data)
+    report_md = load_report_content(data)
 
     return f"""
 GROUND_TRUTH_EXTRACTED_DATA:
 
 OUTLINE_JSON:
-{json.dumps(outline, indent=2)}
+{dumps_compact(payload["outline"])}
 
 CLAIMS_JSON:
-{json.dumps(claims, indent=2)}
+{dumps_compact(payload["claims"])}
 
 METHOD_JSON:
-{json.dumps(method, indent=2)}
+{dumps_compact(payload["method"])}
 
 EXPERIMENTS_JSON:
-{json.dumps(experiments, indent=2)}
+{dumps_compact(payload["experiments"])}
+
+TRACE_VERIFICATION:
+{dumps_compact(payload["trace_verification"])}
+
+NUMERIC_CHECKS:
+{dumps_compact(payload["numeric_checks"])}
 
 GENERATED_MARKDOWN_REPORT:
 {report_md}
@@ -89,25 +162,29 @@ Constraints:
 """
 
 
-def review_report(input_json_path: str, output_json_path: str, model: str):
-    if not os.path.exists(input_json_path):
-        raise FileNotFoundError(f"Input JSON not found: {input_json_path}")
+def review_report(input_json_path: str, output_json_path: str, model: str | None = None, data: dict | None = None, previous: dict | None = None,
+                  ctx: RunContext | None = None):
+    if data is None:
+        if not os.path.exists(input_json_path):
+            raise FileNotFoundError(f"Input JSON not found: {input_json_path}")
 
-    with open(input_json_path, "r", encoding="utf-8") as f:
-        data = json.load(f)
+        data = load_document(input_json_path)
 
-    client = init()
     user_prompt = build_user_prompt(data)
+    fingerprint = prompt_fingerprint("review_report", SYSTEM_PROMPT, user_prompt, model)
+
+    if not reuse_stage_output(data, previous, "review_report", fingerprint, ["review"]):
+        review_json = call_stage_llm(
+            stage="review_report",
+            system_prompt=SYSTEM_PROMPT,
+            user_prompt=user_prompt,
+            model=model,
+            ctx=ctx
+        )
 
-    review_json = call_llm(
-        client=client,
-        system_prompt=SYSTEM_PROMPT,
-        user_prompt=user_prompt,
-        model=model
-    )
+        # Append review into JSON
+        data["review"] = review_json
 
-    # Append review into JSON
-    data["review"] = review_json
+    dump_document(data, output_json_path)
 
-    with open(output_json_path, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
+    return data
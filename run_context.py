@@ -0,0 +1,157 @@
+import threading
+import time
+from profiling import ProfileSettings, profile_stage
+
+
+class RunCancelled(Exception):
+    """
+    Raised inside a stage once its run has been cancelled or has passed its deadline.
+    """
+
+
+# Stage statuses recorded in run_status.json
+COMPLETED = "completed"
+FAILED = "failed"
+CANCELLED = "cancelled"
+SKIPPED = "skipped"
+
+
+class RunContext:
+    """
+    State shared by every stage of one paper's run: a cancellation token, an
+    optional wall-clock deadline, the status of each stage and which stages
+    to profile.
+
+    cancel() may be called from any thread (e.g. a service handler whose client
+    disconnected); in-flight LLM calls registered with on_cancel are closed
+    immediately and the next check() raises RunCancelled.
+    """
+
+    def __init__(self, deadline_seconds: float | None = None, profile: ProfileSettings | None = None):
+        self.started = time.monotonic()
+        self.deadline = self.started + deadline_seconds if deadline_seconds else None
+        self.cancel_event = threading.Event()
+        self.reason = None
+        self.stages = {}
+        self.skip_reason = None
+        self.callbacks = set()
+        self.lock = threading.Lock()
+        self.profile = profile
+
+    def cancel(self, reason: str = "cancelled"):
+        with self.lock:
+            if self.cancel_event.is_set():
+                return
+            self.reason = reason
+            self.cancel_event.set()
+            callbacks = list(self.callbacks)
+
+        for callback in callbacks:
+            callback()
+
+    @property
+    def cancelled(self) -> bool:
+        if not self.cancel_event.is_set() and self.deadline and time.monotonic() >= self.deadline:
+            self.cancel("deadline exceeded")
+        return self.cancel_event.is_set()
+
+    def remaining(self) -> float | None:
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def bound_timeout(self, timeout: float | None) -> float | None:
+        """
+        A stage timeout shortened to what is left of the run's deadline.
+        """
+        remaining = self.remaining()
+        if remaining is None:
+            return timeout
+        return remaining if timeout is None else min(timeout, remaining)
+
+    def check(self):
+        if self.cancelled:
+            raise RunCancelled(self.reason)
+
+    def on_cancel(self, callback):
+        """
+        Register callback to run on cancel(); runs at once if already cancelled.
+        """
+        with self.lock:
+            if not self.cancel_event.is_set():
+                self.callbacks.add(callback)
+                return
+        callback()
+
+    def remove_callback(self, callback):
+        with self.lock:
+            self.callbacks.discard(callback)
+
+    def record(self, stage: str, status: str, seconds: float | None = None, error: str | None = None):
+        entry = {"status": status}
+        if seconds is not None:
+            entry["seconds"] = round(seconds, 3)
+        if error:
+            entry["error"] = error
+        self.stages[stage] = entry
+
+    def skip_remaining(self, reason: str):
+        """
+        Skip every stage not yet run, e.g. when there is nothing to send to the LLM.
+        """
+        self.skip_reason = reason
+
+    def completed(self, stage: str) -> bool:
+        return self.stages.get(stage, {}).get("status") == COMPLETED
+
+    def run_stage(self, stage: str, fn, *args, requires: tuple = (), **kwargs):
+        """
+        Run one stage and record its status instead of raising. A stage is
+        skipped when a stage it requires did not complete, and cancelled when
+        the run was cancelled before or while it ran. Returns fn's result or None.
+        """
+        if self.skip_reason:
+            self.record(stage, SKIPPED, error=self.skip_reason)
+            return None
+
+        missing = [r for r in requires if not self.completed(r)]
+        if missing:
+            self.record(stage, SKIPPED, error=f"requires {', '.join(missing)}")
+            return None
+        if self.cancelled:
+            self.record(stage, CANCELLED, error=self.reason)
+            return None
+
+        start = time.monotonic()
+        try:
+            with profile_stage(stage, self.profile):
+                result = fn(*args, **kwargs)
+        except RunCancelled as e:
+            self.record(stage, CANCELLED, time.monotonic() - start, str(e))
+            return None
+        except Exception as e:
+            status = CANCELLED if self.cancelled else FAILED
+            self.record(stage, status, time.monotonic() - start, f"{type(e).__name__}: {e}")
+            print(f"{stage}: {status} ({type(e).__name__}: {e})")
+            return None
+
+        self.record(stage, COMPLETED, time.monotonic() - start)
+        return result
+
+    def status(self) -> dict:
+        statuses = [s["status"] for s in self.stages.values()]
+        if all(s == COMPLETED for s in statuses):
+            overall = COMPLETED
+        elif self.cancel_event.is_set():
+            overall = CANCELLED
+        elif COMPLETED in statuses:
+            overall = "partial"
+        else:
+            overall = FAILED
+
+        return {
+            "status": overall,
+            "reason": self.reason,
+            "seconds": round(time.monotonic() - self.started, 3),
+            "stages": self.stages
+        }
@@ -0,0 +1,132 @@
+import argparse
+import json
+import os
+import random
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# Latency model: lognormal body around median_seconds, plus a slow tail
+DEFAULT_MEDIAN_SECONDS = 0.2
+DEFAULT_TAIL_PROBABILITY = 0.05
+DEFAULT_TAIL_MULTIPLIER = 10.0
+
+
+class StubLLMHandler(BaseHTTPRequestHandler):
+    """
+    OpenAI-compatible /chat/completions endpoint that returns a fixed JSON
+    answer after a jittered delay. Point GITHUB_AI_ENDPOINT at it.
+    """
+
+    median_seconds = DEFAULT_MEDIAN_SECONDS
+    tail_probability = DEFAULT_TAIL_PROBABILITY
+    tail_multiplier = DEFAULT_TAIL_MULTIPLIER
+
+    def sample_latency(self) -> float:
+        latency = random.lognormvariate(0, 0.25) * self.median_seconds
+        if random.random() < self.tail_probability:
+            latency *= self.tail_multiplier
+        return latency
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self.send_error(404)
+            return
+
+        time.sleep(self.sample_latency())
+
+        response = {
+            "id": "chatcmpl-stub",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": json.dumps({"stub": True})},
+                "finish_reason": "stop"
+            }],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+        }
+        payload = json.dumps(response).encode("utf-8")
+
+        try:
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+        except (BrokenPipeError, ConnectionResetError):
+            # Hedged loser: the client already closed the connection
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(port: int, median_seconds: float, tail_probability: float, tail_multiplier: float) -> ThreadingHTTPServer:
+    StubLLMHandler.median_seconds = median_seconds
+    StubLLMHandler.tail_probability = tail_probability
+    StubLLMHandler.tail_multiplier = tail_multiplier
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), StubLLMHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def latency_summary(latencies: list) -> str:
+    values = sorted(latencies)
+    pct = lambda q: values[min(len(values) - 1, int(q * len(values)))]
+    return f"p50={statistics.median(values):.3f}s p95={pct(0.95):.3f}s p99={pct(0.99):.3f}s max={values[-1]:.3f}s"
+
+
+def run_benchmark(port: int, calls: int):
+    """
+    Compare per-call latency with and without hedging against the stub server.
+    """
+    os.environ["GITHUB_AI_ENDPOINT"] = f"http://127.0.0.1:{port}/v1"
+    os.environ.setdefault("GITHUB_AI_TOKEN", "stub")
+
+    import model_routing
+
+    for hedge in (False, True):
+        model_routing.latency_tracker = model_routing.LatencyTracker()
+        routes = {"review_report": {"models": ["stub"], "hedge": hedge, "timeout": 30}}
+
+        latencies = []
+        original = model_routing.load_route_overrides
+        model_routing.load_route_overrides = lambda: routes
+        try:
+            for _ in range(calls):
+                start = time.monotonic()
+                model_routing.call_stage_llm("review_report", "system", "user", model=None)
+                latencies.append(time.monotonic() - start)
+        finally:
+            model_routing.load_route_overrides = original
+
+        # The first MIN_LATENCY_SAMPLES calls only warm up the p95 estimate
+        measured = latencies[model_routing.MIN_LATENCY_SAMPLES:]
+        print(f"hedge={hedge}: {latency_summary(measured)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Jittery OpenAI-compatible stub server.")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--median", type=float, default=DEFAULT_MEDIAN_SECONDS, help="median latency in seconds")
+    parser.add_argument("--tail-probability", type=float, default=DEFAULT_TAIL_PROBABILITY)
+    parser.add_argument("--tail-multiplier", type=float, default=DEFAULT_TAIL_MULTIPLIER)
+    parser.add_argument("--bench", type=int, metavar="CALLS", help="run CALLS calls with and without hedging, then exit")
+    args = parser.parse_args()
+
+    server = start_server(args.port, args.median, args.tail_probability, args.tail_multiplier)
+
+    if args.bench:
+        run_benchmark(args.port, args.bench)
+    else:
+        print(f"Stub LLM server listening on http://127.0.0.1:{args.port}/v1")
+        threading.Event().wait()
@@ -0,0 +1,51 @@
+import os
+import tempfile
+import unittest
+from corpus_index import connect, ingest_documents, paper_id_for, search
+
+
+def document(file_path: str, page_hash: str, claim: str) -> dict:
+    return {
+        "source": {"file_name": os.path.basename(file_path), "file_path": file_path, "page_count": 1},
+        "pages": [{"page_number": 1, "content_hash": page_hash}],
+        "outline": {"title": None, "abstract": ""},
+        "claims": {
+            "key_claims": [{"claim_id": "C1", "type": "performance", "text": claim, "trace": {"page": 1}}]
+        }
+    }
+
+
+class CorpusIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.conn = connect(os.path.join(self.tmp.name, "corpus.db"))
+
+    def tearDown(self):
+        self.conn.close()
+        self.tmp.cleanup()
+
+    def test_search_hyphenated_and_apostrophe_queries(self):
+        doc = document("a/paper.pdf", "h1", "We don't degrade WMT14 En-De BLEU with GPT-4 distillation.")
+        ingest_documents(self.conn, [("a/output_s6.json", doc)])
+
+        for query in ["en-de", "WMT14 En-De", "GPT-4", "don't"]:
+            self.assertEqual(len(search(self.conn, query)), 1, query)
+        self.assertEqual(search(self.conn, "en-fr"), [])
+        self.assertEqual(search(self.conn, "  "), [])
+
+    def test_same_file_name_without_title_keeps_both_papers(self):
+        first = document("a/paper.pdf", "h1", "First paper claim about attention.")
+        second = document("b/paper.pdf", "h2", "Second paper claim about convolutions.")
+        self.assertNotEqual(paper_id_for(first), paper_id_for(second))
+
+        ingest_documents(self.conn, [("a/output_s6.json", first)])
+        ingest_documents(self.conn, [("b/output_s6.json", second)])
+        self.assertEqual(self.conn.execute("SELECT COUNT(*) FROM papers").fetchone()[0], 2)
+
+        # Re-ingesting the same paper replaces it instead of adding a copy
+        ingest_documents(self.conn, [("a/output_s6.json", first)])
+        self.assertEqual(self.conn.execute("SELECT COUNT(*) FROM papers").fetchone()[0], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
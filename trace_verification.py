@@ -0,0 +1,154 @@
+import json
+import os
+import re
+import unicodedata
+from collections import defaultdict
+from page_store import dump_document, load_document, page_text
+from traces import TRACED_KEYS, iter_traced_items, resolve_trace
+
+
+# Fraction of snippet shingles that must be found on a page for a fuzzy match
+FUZZY_MATCH_THRESHOLD = 0.6
+SHINGLE_SIZE = 3
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normalize PDF text and LLM snippets into a comparable form:
+    NFKC (ligatures), re-joined hyphenated line breaks, lowercase, single spaces.
+    """
+    text = unicodedata.normalize("NFKC", text or "")
+    text = re.sub(r"(\w)-\s*\n\s*(\w)", r"\1\2", text)
+    text = text.lower()
+    text = re.sub(r"[\"'`“”‘’]", "", text)
+    # Table rows are quoted as pipe-separated cells
+    text = text.replace("|", " ")
+    text = re.sub(r"\s+", " ", text)
+    return text.strip()
+
+
+def shingles(words: list, size: int = SHINGLE_SIZE) -> set:
+    if len(words) < size:
+        return {tuple(words)} if words else set()
+    return {tuple(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+class PageTextIndex:
+    """
+    Normalized page text plus an inverted word-shingle index, built once per
+    document so every trace lookup is a dict probe rather than a page scan.
+    """
+
+    def __init__(self, pages: list):
+        self.page_text = {}
+        self.postings = defaultdict(set)
+
+        for page in pages:
+            page_num = page["page_number"]
+            normalized = normalize_text(page_text(page))
+            self.page_text[page_num] = normalized
+
+            words = normalized.split()
+            for size in (1, SHINGLE_SIZE):
+                for sh in shingles(words, size):
+                    self.postings[sh].add(page_num)
+
+    def find_exact(self, snippet: str, page_num) -> int | None:
+        if snippet in self.page_text.get(page_num, ""):
+            return page_num
+        for num, text in self.page_text.items():
+            if num != page_num and snippet in text:
+                return num
+        return None
+
+    def find_fuzzy(self, snippet: str, page_num) -> tuple:
+        words = snippet.split()
+        size = SHINGLE_SIZE if len(words) >= SHINGLE_SIZE else 1
+        snippet_shingles = shingles(words, size)
+        if not snippet_shingles:
+            return None, 0.0
+
+        hits = defaultdict(int)
+        for sh in snippet_shingles:
+            for num in self.postings.get(sh, ()):
+                hits[num] += 1
+
+        if not hits:
+            return None, 0.0
+
+        # Prefer the cited page on ties
+        best = max(hits, key=lambda num: (hits[num], num == page_num))
+        return best, hits[best] / len(snippet_shingles)
+
+
+def verify_snippet(index: PageTextIndex, page_num, snippet: str) -> dict:
+    normalized = normalize_text(snippet)
+    # LLMs often elide with "..." - match the longest fragment
+    fragments = [f.strip() for f in re.split(r"\.\.\.|…", normalized) if f.strip()]
+    if not fragments:
+        return {"status": "unverified", "verified": False, "matched_page": None, "score": 0.0}
+
+    fragment = max(fragments, key=len)
+
+    matched_page = index.find_exact(fragment, page_num)
+    score = 1.0
+    if matched_page is None:
+        matched_page, score = index.find_fuzzy(fragment, page_num)
+        if score < FUZZY_MATCH_THRESHOLD:
+            matched_page = None
+
+    if matched_page is None:
+        status = "unverified"
+    elif matched_page == page_num:
+        status = "verified"
+    else:
+        status = "wrong_page"
+
+    return {
+        "status": status,
+        "verified": status == "verified",
+        "matched_page": matched_page,
+        "score": round(score, 3)
+    }
+
+
+def verify_traces(data: dict) -> dict:
+    index = PageTextIndex(data.get("pages", []))
+
+    summary = {"checked": 0, "verified": 0, "wrong_page": 0, "unverified": 0, "issues": []}
+
+    for key in TRACED_KEYS:
+        for path, item in iter_traced_items(data.get(key, {}), key):
+            trace = resolve_trace(data, item["trace"])
+            result = verify_snippet(index, trace.get("page"), trace.get("snippet", ""))
+            if "id" in item["trace"]:
+                data["trace_table"][item["trace"]["id"]]["verification"] = result
+            else:
+                item["trace"]["verification"] = result
+
+            summary["checked"] += 1
+            summary[result["status"]] += 1
+            if result["status"] != "verified":
+                summary["issues"].append({
+                    "path": path,
+                    "status": result["status"],
+                    "cited_page": trace.get("page"),
+                    "matched_page": result["matched_page"],
+                    "snippet": trace.get("snippet", "")
+                })
+
+    data["trace_verification"] = summary
+    return summary
+
+
+def verify_trace_stage(input_json: str, output_json: str):
+    if not os.path.exists(input_json):
+        raise FileNotFoundError(f"Input JSON not found: {input_json}")
+
+    data = load_document(input_json)
+
+    verify_traces(data)
+
+    dump_document(data, output_json)
+
+    return data
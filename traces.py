@@ -0,0 +1,138 @@
+import json
+import os
+import re
+from page_store import dump_document, load_document, page_text
+
+
+# Top-level document keys whose items carry trace objects
+TRACED_KEYS = ["claims", "method", "experiments"]
+
+
+def iter_traced_items(value, path: str):
+    if isinstance(value, list):
+        for i, v in enumerate(value):
+            yield from iter_traced_items(v, f"{path}[{i}]")
+    elif isinstance(value, dict):
+        if isinstance(value.get("trace"), dict):
+            yield path, value
+        for key, v in value.items():
+            if key != "trace":
+                yield from iter_traced_items(v, f"{path}.{key}")
+
+
+def locate_snippet(text: str, snippet: str) -> tuple:
+    """
+    Character offsets of snippet in a page's text, tolerating different
+    whitespace and line breaks. (None, None) if it isn't there verbatim.
+    """
+    start = text.find(snippet) if snippet else -1
+    if start >= 0:
+        return start, start + len(snippet)
+
+    words = snippet.split()
+    if not words:
+        return None, None
+    match = re.search(r"\s+".join(re.escape(w) for w in words), text)
+    return (match.start(), match.end()) if match else (None, None)
+
+
+def build_trace_table(data: dict) -> dict:
+    """
+    Move every item's trace snippet into data["trace_table"] as
+    {"T1": {"page", "snippet", "start", "end", ...}} and leave {"id", "page"}
+    on the item. Identical (page, snippet) pairs share one id. Items already
+    referencing the table are left alone.
+    """
+    table = data.get("trace_table", {})
+    ids = {(entry["page"], entry["snippet"]): trace_id for trace_id, entry in table.items()}
+    pages = {page["page_number"]: page for page in data.get("pages", [])}
+    texts = {}
+
+    for key in TRACED_KEYS:
+        for _, item in iter_traced_items(data.get(key, {}), key):
+            trace = item["trace"]
+            if "id" in trace:
+                continue
+
+            page_num = trace.get("page")
+            snippet = (trace.get("snippet") or "").strip()
+
+            trace_id = ids.get((page_num, snippet))
+            if trace_id is None:
+                trace_id = f"T{len(table) + 1}"
+                if page_num not in texts:
+                    texts[page_num] = page_text(pages[page_num]) if page_num in pages else ""
+                start, end = locate_snippet(texts[page_num], snippet)
+
+                entry = {"page": page_num, "snippet": snippet, "start": start, "end": end}
+                if "verification" in trace:
+                    entry["verification"] = trace["verification"]
+
+                table[trace_id] = entry
+                ids[(page_num, snippet)] = trace_id
+
+            item["trace"] = {"id": trace_id, "page": page_num}
+
+    data["trace_table"] = table
+    return table
+
+
+def resolve_trace(data: dict, trace: dict) -> dict:
+    """
+    The full trace of an item, whether it is inline or a trace table reference.
+    """
+    if "id" not in trace:
+        return trace
+    return {**data.get("trace_table", {}).get(trace["id"], {}), **trace}
+
+
+def expand_traces(value, table: dict):
+    """
+    Copy of value with trace table references replaced by inline {page, snippet}
+    traces, for outputs copied from a document with a different trace table.
+    """
+    if isinstance(value, list):
+        return [expand_traces(v, table) for v in value]
+    if not isinstance(value, dict):
+        return value
+
+    expanded = {}
+    for key, v in value.items():
+        if key == "trace" and isinstance(v, dict) and "id" in v:
+            entry = table.get(v["id"], {})
+            expanded[key] = {"page": v.get("page", entry.get("page")), "snippet": entry.get("snippet", "")}
+        else:
+            expanded[key] = expand_traces(v, table)
+    return expanded
+
+
+def compact_traces(value, drop_fields: set = frozenset()):
+    """
+    Copy of value for prompts: traces reduced to their page, and drop_fields
+    removed from every item.
+    """
+    if isinstance(value, list):
+        return [compact_traces(v, drop_fields) for v in value]
+    if not isinstance(value, dict):
+        return value
+
+    compact = {}
+    for key, v in value.items():
+        if key == "trace" and isinstance(v, dict):
+            compact[key] = {"page": v.get("page")}
+        elif key not in drop_fields:
+            compact[key] = compact_traces(v, drop_fields)
+    return compact
+
+
+def trace_table_stage(input_json: str, output_json: str):
+    if not os.path.exists(input_json):
+        raise FileNotFoundError(f"Input JSON not found: {input_json}")
+
+    data = load_document(input_json)
+
+    build_trace_table(data)
+
+    dump_document(data, output_json)
+
+    return data